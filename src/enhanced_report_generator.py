@@ -1,28 +1,26 @@
 import pandas as pd
-import yaml
 from reportlab.platypus.tables import TableStyle
-from reportlab.lib.pagesizes import A4, letter, landscape
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Table, Image
-from reportlab.platypus.flowables import PageBreak, Spacer, HRFlowable, KeepTogether
-from reportlab.platypus.tableofcontents import TableOfContents
-from reportlab.lib.units import inch, cm
+from reportlab.lib.pagesizes import A2, A4, letter, landscape
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Table
+from reportlab.platypus.flowables import PageBreak, Spacer, HRFlowable
+from reportlab.lib.units import inch
 from reportlab.lib import colors
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.enums import TA_LEFT, TA_CENTER, TA_RIGHT
-from jinja2 import Environment, FileSystemLoader
-from PyPDF2 import PdfReader, PdfWriter
-import pdfkit
+from reportlab.lib.enums import TA_LEFT
 import io
-import re
-import datetime
+import json
 from datetime import datetime
 import os
-import tempfile
 import logging
+import itertools
 import numpy as np
+from report_generator import ReportEngine as BaseReportEngine
+from report_generator import (FlagManager, CellFormatter, PlainTextCell, StreamingTable, FrontPageCache,
+                              HtmlToPdfConverter, ConverterUnavailable, CoverPageMerger, FilterMaskCache,
+                              FilterExpression, FilterCriteriaStore, FlagSink,
+                              GroupedAggregator, StyledRow, ReportDataLoader,
+                              ExtractCache)
 
-# Set up logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class ReportEngine:
@@ -36,6 +34,26 @@ class ReportEngine:
         self.bookmarks = {}  # Changed to dict for easier page number lookup
         self.flag_manager = FlagManager(config["flag_rules"])
         
+        # Flagged records are batched over the run and committed once
+        self.flag_sink = FlagSink.from_config(db_cursor, self.common)
+        self.flag_manager.db_cursor = db_cursor
+        self.flag_manager.flag_sink = self.flag_sink
+        self.cell_formatter = CellFormatter()
+        
+        # Tables with more data rows than this are streamed in page-sized chunks
+        self.streaming_row_threshold = self.common.get("streaming_row_threshold", 1000)
+        
+        # Rendered front pages are reused across reports with the same cover HTML
+        self.front_page_cache = FrontPageCache.from_config(self.common)
+        
+        # Filter masks and column indexes for the DataFrame currently being reported on
+        self.filter_column_index = self.common.get("filter_column_index", True)
+        self.filter_masks = None
+        self.aggregator = None
+        
+        # Section filters stored in the database, loaded once per report
+        self.filter_criteria_store = FilterCriteriaStore.from_config(db_cursor, self.common)
+        
         # Set up page size and margins
         self.page_size = landscape(A4)
         self.page_width, self.page_height = self.page_size
@@ -286,13 +304,32 @@ class ReportEngine:
     def prepare_table_data(self, report_column_info, dataframe, multi_level_headers=None):
         """Prepare table data with support for multi-level headers and group colors."""
         custom_style = self.get_custom_style()
-        table_data = []
-        header_rows = {}
         
         # If multi_level_headers is None, initialize it as an empty list
         if multi_level_headers is None:
             multi_level_headers = []
         
+        header_rows, style_commands = self.build_header_rows(report_column_info)
+        header_offset = len(header_rows) - 1
+        
+        # Add data rows
+        data_rows = []
+        if dataframe is not None and not dataframe.empty:
+            for data_row in self.cell_formatter.format_rows(dataframe, report_column_info):
+                data_rows.append([PlainTextCell.for_text(cell_value, custom_style) for cell_value in data_row])
+        
+        # Alternating row colors
+        for row_idx in range(header_offset + 1, header_offset + 1 + len(data_rows), 2):
+            style_commands.append(('BACKGROUND', (0, row_idx), (-1, row_idx), colors.HexColor("#F8F9FA")))
+        
+        return data_rows, style_commands
+
+    def build_header_rows(self, report_column_info):
+        """Build the group and column header rows with their table style commands."""
+        custom_style = self.get_custom_style()
+        table_data = []
+        header_rows = {}
+        
         # First, organize columns by groups
         groups = {}
         for col_info in report_column_info:
@@ -304,18 +341,15 @@ class ReportEngine:
         
         # If we have groups, create a group header row
         if groups:
-            group_row = []
             current_group = None
             group_span = 0
-            group_spans = []  # Store spans for styling
+            group_spans = []  # Store (start column, span) for styling
             
-            for col_info in report_column_info:
+            for col_idx, col_info in enumerate(report_column_info):
                 group = col_info.get("group")
                 if group != current_group:
                     if current_group and group_span > 0:
-                        cell = Paragraph(f"<b>{current_group}</b>", custom_style)
-                        group_row.append(cell)
-                        group_spans.append((len(group_row)-1, group_span))
+                        group_spans.append((col_idx - group_span, group_span))
                     current_group = group
                     group_span = 1
                 else:
@@ -323,9 +357,15 @@ class ReportEngine:
             
             # Add the last group
             if current_group and group_span > 0:
-                cell = Paragraph(f"<b>{current_group}</b>", custom_style)
-                group_row.append(cell)
-                group_spans.append((len(group_row)-1, group_span))
+                group_spans.append((len(report_column_info) - group_span, group_span))
+            
+            # Place each group label in its first column so spans line up with the columns
+            group_row = []
+            if group_spans:
+                group_row = [""] * len(report_column_info)
+                for group_idx, span in group_spans:
+                    group_name = report_column_info[group_idx].get("group")
+                    group_row[group_idx] = Paragraph(f"<b>{group_name}</b>", custom_style)
             
             # Add the group row to table data
             if group_row:  # Only add if there are actual groups
@@ -346,26 +386,6 @@ class ReportEngine:
             "levels": [col_info.get("level", 1) for col_info in report_column_info]
         }
         
-        # Add data rows
-        data_rows = []
-        if dataframe is not None and not dataframe.empty:
-            for _, row in dataframe.iterrows():
-                data_row = []
-                for col_info in report_column_info:
-                    column_name = col_info.get("name", col_info.get("column", ""))
-                    if column_name in row:
-                        cell_value = row[column_name]
-                        if pd.isna(cell_value):
-                            cell_value = ""
-                        elif isinstance(cell_value, (float, np.floating)):
-                            cell_value = f"{cell_value:.2f}"
-                        cell = Paragraph(str(cell_value), custom_style)
-                        data_row.append(cell)
-                    else:
-                        # Handle missing columns gracefully
-                        data_row.append(Paragraph("", custom_style))
-                data_rows.append(data_row)
-        
         # Create table style commands
         style_commands = []
         
@@ -404,11 +424,64 @@ class ReportEngine:
                 ('FONTNAME', (col_idx, header_offset), (col_idx, header_offset), 'Helvetica-Bold'),
             ])
         
-        # Alternating row colors
-        for row_idx in range(header_offset + 1, header_offset + 1 + len(data_rows), 2):
-            style_commands.append(('BACKGROUND', (0, row_idx), (-1, row_idx), colors.HexColor("#F8F9FA")))
+        return table_data, style_commands
+
+    def create_streaming_table(self, report_column_info, dataframe, extra_rows=None, subtotals=None,
+                               subtotal_config=None):
+        """
+        Create a table that streams rows from the DataFrame in page-sized chunks.
+
+        Uses the same header row and style as the single Table render_table builds for
+        smaller sections, so only the pagination differs; the header row is repeated on
+        every page. extra_rows (e.g. totals) are appended after the data, and subtotals
+        (from GroupedAggregator.subtotals) are placed inline under each group.
+        """
+        custom_style = self.get_custom_style()
+        header_row, style_commands = self.build_table_header(report_column_info, custom_style)
         
-        return data_rows, style_commands
+        rows = iter(())
+        if dataframe is not None and not dataframe.empty:
+            rows = self.cell_formatter.iter_rows(dataframe, report_column_info)
+            if subtotals is not None:
+                rows = self.iter_rows_with_subtotals(rows, subtotals, subtotal_config,
+                                                     len(report_column_info), custom_style)
+        if extra_rows:
+            rows = itertools.chain(rows, extra_rows)
+        
+        return StreamingTable(
+            [header_row],
+            rows,
+            style_commands=style_commands,
+            cell_factory=lambda value: PlainTextCell.for_text(value, custom_style) if isinstance(value, str) else value,
+            alt_row_color=colors.HexColor("#F8F9FA")
+        )
+
+    def build_table_header(self, report_columns_info, custom_style):
+        """
+        Header row and base style commands for a render_table table.
+
+        Shared by the single Table and the streamed table so both look the same. The
+        commands only target the header row or the whole table, so they also apply to
+        each streamed chunk.
+
+        Returns:
+            tuple: (header_row, style_commands)
+        """
+        header_row = []
+        for col_info in report_columns_info:
+            header_text = col_info.get('header', col_info.get('display_name', col_info.get('name', '')))
+            header_cell = Paragraph(f"<b>{header_text}</b>", custom_style)
+            header_row.append(header_cell)
+        
+        style_commands = [
+            ('ALIGN', (0, 0), (-1, 0), 'CENTER'),  # Center align header
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor("#34495E")),  # Header background
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),  # Header text color
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),  # Header font
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 8),  # Header padding
+            ('GRID', (0, 0), (-1, -1), 0.25, colors.HexColor("#E0E0E0")),  # Grid lines
+        ]
+        return header_row, style_commands
 
     def create_table_style(self, style_config, data=None):
         """Create a TableStyle with modern, professional formatting."""
@@ -485,22 +558,43 @@ class ReportEngine:
 
     def render_front_page(self, effective_date):
         """ Render the first page using Jinja2 and convert it to PDF. """
+        cover_date = effective_date
+        from jinja2 import Environment, FileSystemLoader
         env = Environment(loader=FileSystemLoader("./templates"))
         template = env.get_template("front_page.html")
         if isinstance(effective_date, str):
             effective_date = datetime.strptime(effective_date, "%Y-%m-%d").strftime("%B %d, %Y")
         html_content = template.render({"config": self.config['front_page'], "effective_date": effective_date})
-        temp_file_name = "temp_html.html"
-
-        with open(temp_file_name, "w") as file:
-            file.write(html_content)
 
         executable_path = "/ms/dist/fsf/PROJ/wkhtmltopdf-0.12.6/bin/wkhtmltopdf"
-        pdf_config = pdfkit.configuration(wkhtmltopdf=executable_path)
-        pdf_bytes = pdfkit.from_file(temp_file_name, False, configuration=pdf_config,
-                                     options={"enable-local-file-access": "", "page-size": "A4", "orientation": "Landscape"})
+        options = {"enable-local-file-access": "", "page-size": "A4", "orientation": "Landscape"}
+        converter = HtmlToPdfConverter.shared(
+            executable_path,
+            options,
+            pool_size=self.common.get("html_converter_pool_size", 2),
+            timeout=self.common.get("html_converter_timeout", 30),
+            acquire_timeout=self.common.get("html_converter_acquire_timeout", 5)
+        )
+
+        # The cover only depends on the rendered HTML, so reuse an earlier conversion
+        cache_key = self.front_page_cache.key_for(html_content, converter.command)
+        pdf_bytes = self.front_page_cache.get(cache_key)
+        if pdf_bytes is not None:
+            return pdf_bytes
+
+        try:
+            pdf_bytes = converter.convert(html_content)
+        except ConverterUnavailable as e:
+            logger.error(f"Error converting HTML to PDF with wkhtmltopdf: {str(e)}")
+            return self._create_fallback_front_page(cover_date)
+
+        self.front_page_cache.put(cache_key, pdf_bytes)
         return pdf_bytes
 
+    def _create_fallback_front_page(self, effective_date):
+        """Create a simple front page using ReportLab when wkhtmltopdf is not available."""
+        return BaseReportEngine._create_fallback_front_page(self, effective_date)
+
     def generate_report_pages(self):
         """Generate report pages using ReportLab with bookmark support."""
         buffer = io.BytesIO()
@@ -535,20 +629,14 @@ class ReportEngine:
         doc.build(elements, onFirstPage=self.on_page, onLaterPages=self.on_page)
         return buffer.getvalue()
 
-    def combine_pdfs(self, pdf_front, pdf_report):
-        output_pdf = PdfWriter()
-        front_pdf_reader = PdfReader(io.BytesIO(pdf_front))
-        report_pdf_reader = PdfReader(io.BytesIO(pdf_report))
-
-        # Add the front page
-        output_pdf.add_page(front_pdf_reader.pages[0])
-
-        # Add remaining report pages
-        for page in report_pdf_reader.pages:
-            output_pdf.add_page(page)
-
-        with open("combined_report.pdf", "wb") as outfile:
-            output_pdf.write(outfile)
+    def combine_pdfs(self, pdf_front, pdf_report, output="combined_report.pdf"):
+        """Put the front page in front of the report, streaming the result to a path or writable stream."""
+        if isinstance(output, (str, os.PathLike)):
+            with open(output, "wb") as outfile:
+                CoverPageMerger().merge(pdf_front, pdf_report, outfile)
+        else:
+            CoverPageMerger().merge(pdf_front, pdf_report, output)
+        return output
 
     def run_report(self):
         """Run the report generation process using the generate_pdf_report method."""
@@ -557,9 +645,10 @@ class ReportEngine:
         # Load sample data for demonstration
         try:
             # Try to load sample data from CSV if available
-            sample_data_path = "sample_data.csv"
+            sample_data_path = self.common.get("input_path", "sample_data.csv")
             if os.path.exists(sample_data_path):
-                df = pd.read_csv(sample_data_path)
+                df = ReportDataLoader(self.config, ExtractCache.from_config(self.common),
+                                      self.filter_criteria_store).load(sample_data_path)
                 print(f"Loaded sample data with {len(df)} rows")
             else:
                 # Create dummy data if no CSV is available
@@ -641,9 +730,12 @@ class ReportEngine:
         section_num = 1
         subsection_num = 1
         
-        for section in self.reports['topics']:
-            title = section['title']
-            content = section['content']
+        plan, table_configs = self.build_render_plan()
+        rendered_tables = {}
+
+        for topic, table_keys in plan:
+            title = topic['title']
+            content = topic['content']
             
             # Create section title with bookmark
             section_title = Paragraph(title, self.styles['Heading1'])
@@ -653,150 +745,14 @@ class ReportEngine:
             
             elements.append(section_title)
             elements.append(Paragraph(f"{content}", self.styles['TOCHeading2']))
-            elements.append(PageBreak())
-            self.current_page += 1  # Increment page counter
-
-            for section in self.reports['topics']:
-                elements.append(Paragraph(section['title'], self.styles['Heading1']))
-                elements.append(Paragraph(section['content'], self.styles['Heading2']))
-                elements.append(Spacer(1, 12))
-
-                for table_config in section['sections']:
-                    db_filter_criteria = None
-                    filtered_df = {}
-
-                    if db_filter_criteria:
-                        filter_criteria = db_filter_criteria
-                    else:
-                        section = table_config.get('section')
-                        filter_criteria = section.get('filter_criteria', {}) if section else {}
-
-                    if not filter_criteria:
-                        print("No filter criteria available. Skipping filtering step.")
-                        filtered_df = df.copy()
-                    else:
-                        filtered_df = df.copy()
-                        for column, condition in filter_criteria.items():
-                            filtered_df = self.apply_filter(filtered_df, column, condition)
-
-                    # Get column information
-                    report_columns_info = table_config['report_columns_info']
-                    
-                    # Create custom style for text
-                    custom_style = self.get_custom_style()
-                    
-                    # Create table data structure
-                    table_data = []
-                    
-                    # Create header row
-                    header_row = []
-                    for col_info in report_columns_info:
-                        header_text = col_info.get('header', col_info.get('display_name', col_info.get('name', '')))
-                        header_cell = Paragraph(f"<b>{header_text}</b>", custom_style)
-                        header_row.append(header_cell)
-                    
-                    # Add header row to table data
-                    table_data.append(header_row)
-                    
-                    # Add data rows
-                    if filtered_df is not None and not filtered_df.empty:
-                        for _, row in filtered_df.iterrows():
-                            data_row = []
-                            for col_info in report_columns_info:
-                                column_name = col_info.get('name', col_info.get('column', ''))
-                                if column_name in row:
-                                    cell_value = row[column_name]
-                                    if pd.isna(cell_value):
-                                        cell_value = ""
-                                    elif isinstance(cell_value, (float, np.floating)):
-                                        cell_value = f"{cell_value:.2f}"
-                                    cell = Paragraph(str(cell_value), custom_style)
-                                    data_row.append(cell)
-                                else:
-                                    # Handle missing columns gracefully
-                                    data_row.append(Paragraph("", custom_style))
-                            table_data.append(data_row)
-                    
-                    # Process flag data
-                    flagged_data = []
-                    for rule_key, rule in self.config['flag_rules'].items():
-                        conditions = rule['conditions']
-                        severity = rule['severity']
-                        color = rule['color']
-                        text_color = rule['text_color']
-                        column = rule['field']
-
-                        if filtered_df is not None:
-                            for index, row in filtered_df.iterrows():
-                                if self.flag_manager.evaluate_conditions(row, conditions):
-                                    flagged_data.append({
-                                        'index': index,
-                                        'column': column,
-                                        'color': color,
-                                        'severity': severity,
-                                        'text_color': text_color
-                                    })
-
-                    self.flag_manager.save_flagged_data(flagged_data, 'flag_records')
-                    
-                    # Calculate grand total
-                    grand_total = filtered_df['MARKET_VALUE'].sum() if filtered_df is not None and 'MARKET_VALUE' in filtered_df.columns else 0
-                    
-                    # Add grand total row
-                    grand_total_row = [Paragraph('<b>Grand Total</b>', custom_style)]
-                    # Add empty cells for middle columns
-                    for _ in range(len(header_row) - 2):
-                        grand_total_row.append(Paragraph('', custom_style))
-                    # Add the total value in the last column
-                    grand_total_row.append(Paragraph(f"{round(grand_total, 2)}", custom_style))
-                    table_data.append(grand_total_row)
-                    
-                    # Add aggregated team data if available
-                    if filtered_df is not None and 'INVESTMENT_TEAM_NAME' in filtered_df.columns and 'INVESTMENT_SUB_TEAM_NAME' in filtered_df.columns:
-                        try:
-                            aggregated_values_team = filtered_df.groupby(['INVESTMENT_TEAM_NAME', 'INVESTMENT_SUB_TEAM_NAME'])["MARKET_VALUE"].sum().reset_index()
-                            
-                            for _, team_row in aggregated_values_team.iterrows():
-                                investment_team_name = team_row['INVESTMENT_TEAM_NAME']
-                                investment_sub_team_name = team_row['INVESTMENT_SUB_TEAM_NAME']
-                                aggregated_value = team_row['MARKET_VALUE']
-                                
-                                formatted_row = [
-                                    Paragraph(f"<b>{investment_team_name}</b>", custom_style),
-                                    Paragraph(f"{investment_sub_team_name}", custom_style)
-                                ]
-                                # Add empty cells for middle columns if needed
-                                for _ in range(len(header_row) - 3):
-                                    formatted_row.append(Paragraph('', custom_style))
-                                # Add the aggregated value in the last column
-                                formatted_row.append(Paragraph(f"{aggregated_value:.2f}", custom_style))
-                                table_data.append(formatted_row)
-                        except Exception as e:
-                            print(f"Error aggregating team data: {e}")
-                    
-                    # Create table style
-                    header_styles = [
-                        ('ALIGN', (0, 0), (-1, 0), 'CENTER'),  # Center align header
-                        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor("#34495E")),  # Header background
-                        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),  # Header text color
-                        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),  # Header font
-                        ('BOTTOMPADDING', (0, 0), (-1, 0), 8),  # Header padding
-                        ('GRID', (0, 0), (-1, -1), 0.25, colors.HexColor("#E0E0E0")),  # Grid lines
-                    ]
-                    
-                    # Add alternating row colors
-                    for row_idx in range(1, len(table_data), 2):
-                        header_styles.append(('BACKGROUND', (0, row_idx), (-1, row_idx), colors.HexColor("#F8F9FA")))
-                    
-                    # Create the table style
-                    table_style = TableStyle(header_styles)
-                    
-                    # Create the table
-                    table = Table(table_data)
-                    table.setStyle(table_style)
-                    
-                    elements.append(table)
-                    elements.append(PageBreak())
+            elements.append(Spacer(1, 12))
+
+            for table_key in table_keys:
+                # Each distinct table is filtered, flagged and formatted once
+                if table_key not in rendered_tables:
+                    rendered_tables[table_key] = self.render_table(table_configs[table_key], df)
+                elements.extend(rendered_tables[table_key]())
+                self.current_page += 1  # Increment page counter
 
         toc_elements = self.build_table_of_contents()
         elements = toc_elements + elements
@@ -805,54 +761,276 @@ class ReportEngine:
 
         pdf_front_page = self.render_front_page(formatted_effective_date)
 
-        final_pdf = PdfWriter()
+        # The report body is copied through as-is with the cover appended, not re-parsed
+        self.combine_pdfs(pdf_front_page, buffer.getvalue(), file_name_with_date)
 
-        front_pdf_reader = PdfReader(io.BytesIO(pdf_front_page))
-        report_pdf_reader = PdfReader(buffer)
+        # Flagged records from every table are committed together
+        if self.flag_sink is not None:
+            self.flag_sink.close()
 
-        final_pdf.add_page(front_pdf_reader.pages[0])
+        return file_name_with_date, flagged_items_summary
+
+    def build_render_plan(self):
+        """
+        Resolve the configured topics into an ordered render plan.
 
-        for page in report_pdf_reader.pages:
-            final_pdf.add_page(page)
+        Returns:
+            tuple: ([(topic, [table_key, ...]), ...], {table_key: table_config}); a table
+            configured under several topics gets one key and is rendered once.
+        """
+        plan = []
+        table_configs = {}
+        for topic in self.reports['topics']:
+            table_keys = []
+            for table_config in topic.get('sections', []):
+                table_key = json.dumps(table_config, sort_keys=True, default=str)
+                table_configs.setdefault(table_key, table_config)
+                table_keys.append(table_key)
+            plan.append((topic, table_keys))
+        return plan, table_configs
 
-        with open(file_name_with_date, 'wb') as outfile:
-            final_pdf.write(outfile)
+    def render_table(self, table_config, df):
+        """
+        Filter, flag and format the data for one configured table.
 
-        return file_name_with_date, flagged_items_summary
+        Returns:
+            callable: Builds the table's flowables; call it once per place the table appears.
+        """
+        db_filter_criteria = None
+        filtered_df = {}
+
+        if self.reports.get('filter_criteria_from_db'):
+            report_name = self.reports.get('report_name', self.reports['filename'])
+            section_name = table_config.get('section_name', table_config.get('title'))
+            db_filter_criteria = self.filter_criteria_store.get(report_name, section_name)
+
+        if db_filter_criteria:
+            filter_criteria = db_filter_criteria
+        else:
+            section = table_config.get('section')
+            filter_criteria = section.get('filter_criteria', {}) if section else {}
+
+        if not filter_criteria:
+            print("No filter criteria available. Skipping filtering step.")
+
+        # Masks are cached per condition and shared with every other table over the same frame
+        filtered_df = self.get_filter_masks(df).filter(filter_criteria)
+
+        # Configured subtotals order the rows by group and add a row under each group
+        subtotal_config = self.get_subtotal_config(table_config)
+        subtotals = None
+        display_df = filtered_df
+        if subtotal_config and all(column in df.columns for column in subtotal_config['group_by']):
+            subtotals = self.get_aggregator(df).subtotals(filter_criteria, subtotal_config['group_by'],
+                                                          subtotal_config['measures'])
+            display_df = df.iloc[subtotals['positions']]
+
+        # Get column information
+        report_columns_info = table_config['report_columns_info']
+        
+        # Create custom style for text
+        custom_style = self.get_custom_style()
+        
+        # Header row and base style, shared with the streamed table
+        header_row, header_styles = self.build_table_header(report_columns_info, custom_style)
+        
+        # Create table data structure
+        table_data = [header_row]
+        
+        # Large sections are streamed in page-sized chunks instead of one Table
+        stream_rows = filtered_df is not None and len(filtered_df) > self.streaming_row_threshold
+        
+        # Add data rows
+        subtotal_styles = []
+        if display_df is not None and not display_df.empty and not stream_rows:
+            data_rows = self.cell_formatter.format_rows(display_df, report_columns_info)
+            if subtotals is not None:
+                data_rows = self.iter_rows_with_subtotals(data_rows, subtotals, subtotal_config,
+                                                          len(header_row), custom_style)
+            for data_row in data_rows:
+                if isinstance(data_row, StyledRow):
+                    subtotal_styles.extend(data_row.commands_at(len(table_data)))
+                    table_data.append(data_row)
+                else:
+                    table_data.append([PlainTextCell.for_text(cell_value, custom_style) for cell_value in data_row])
+        
+        # Process flag data with the compiled rule masks
+        flagged_data = self.flag_manager.flag_dataframe(filtered_df)
+
+        self.flag_manager.save_flagged_data(flagged_data, 'flag_records')
+        
+        # Totals and group rows come from one grouped pass over the cached filter mask
+        measures, levels = self.get_aggregation_config(table_config)
+        aggregates = self.get_aggregator(df).aggregate(filter_criteria, measures, levels)
+        summary_rows = self.build_summary_rows(aggregates, measures, levels, len(header_row), custom_style)
+        
+        if stream_rows:
+            return lambda: [self.create_streaming_table(report_columns_info, display_df, extra_rows=summary_rows,
+                                                        subtotals=subtotals, subtotal_config=subtotal_config),
+                            PageBreak()]
+        
+        table_data.extend(summary_rows)
+        
+        # Add alternating row colors
+        for row_idx in range(1, len(table_data), 2):
+            header_styles.append(('BACKGROUND', (0, row_idx), (-1, row_idx), colors.HexColor("#F8F9FA")))
+        
+        # Subtotal row styling goes last so it wins over the row banding
+        header_styles.extend(subtotal_styles)
+        
+        # Create the table style
+        table_style = TableStyle(header_styles)
+        
+        # A fresh Table per placement so a shared table can appear under several topics
+        return lambda: [Table(table_data, style=table_style), PageBreak()]
+
+    def get_aggregation_config(self, table_config):
+        """
+        Measures and grouping levels for a table's total rows.
+
+        Read from the table's 'aggregation' section, then the report's, defaulting to the
+        MARKET_VALUE sum by investment team and sub-team.
+        """
+        aggregation = table_config.get('aggregation', self.reports.get('aggregation', {}))
+        measures = aggregation.get('measures', GroupedAggregator.DEFAULT_MEASURES)
+        levels = aggregation.get('levels', GroupedAggregator.DEFAULT_LEVELS)
+        return measures, levels
+
+    def get_aggregator(self, df):
+        """Return the grouped aggregator over df's filter masks."""
+        filter_masks = self.get_filter_masks(df)
+        if self.aggregator is None or self.aggregator.mask_cache is not filter_masks:
+            self.aggregator = GroupedAggregator(filter_masks)
+        return self.aggregator
+
+    def format_measure_cells(self, values, measures, custom_style):
+        """Cells for one row of measure values; counts default to whole numbers."""
+        cells = []
+        for value, measure in zip(values, measures):
+            if value is None or (isinstance(value, float) and np.isnan(value)):
+                text = ""
+            else:
+                precision = measure.get('precision', 0 if measure['func'] == 'count' else None)
+                text = self.cell_formatter.format_value(value, measure.get('format'), precision)
+            cells.append(PlainTextCell.for_text(text, custom_style))
+        return cells
+
+    def build_measure_row(self, label_cells, values, measures, column_count, custom_style):
+        """Label cells first, measure cells in the trailing columns, blanks in between."""
+        padding = max(column_count - len(label_cells) - len(values), 0)
+        return (label_cells + [Paragraph('', custom_style) for _ in range(padding)]
+                + self.format_measure_cells(values, measures, custom_style))
+
+    def get_subtotal_config(self, table_config):
+        """
+        Inline subtotal settings from the table's or the report's 'subtotals' section, or None.
+
+        Keys: group_by (list of columns, outermost first), measures (defaults to the table's
+        aggregation measures) and styles (one dict per level with background and line_color;
+        the last one is reused for deeper levels).
+        """
+        subtotals = table_config.get('subtotals', self.reports.get('subtotals'))
+        if not subtotals or not subtotals.get('group_by'):
+            return None
+        measures = subtotals.get('measures') or self.get_aggregation_config(table_config)[0]
+        return {
+            'group_by': list(subtotals['group_by']),
+            'measures': GroupedAggregator.normalize_measures(measures),
+            'styles': subtotals.get('styles') or [{'background': '#E8EEF4', 'line_color': '#34495E'}],
+        }
+
+    def iter_rows_with_subtotals(self, data_rows, subtotals, subtotal_config, column_count, custom_style):
+        """
+        Yield data rows with a StyledRow subtotal after the last row of each group.
+
+        data_rows must be in the order of subtotals['positions']; where groups of several
+        levels end on the same row the innermost subtotal comes first.
+        """
+        measures = subtotal_config['measures']
+        names = [measure['name'] for measure in measures]
+        levels = subtotals['levels']
+
+        breaks = {}
+        for depth in reversed(range(len(levels))):
+            for group_idx, end in enumerate(levels[depth]['ends']):
+                breaks.setdefault(int(end), []).append((depth, group_idx))
+
+        for row_idx, row in enumerate(data_rows):
+            yield row
+            for depth, group_idx in breaks.get(row_idx, ()):
+                level = levels[depth]
+                key_values = [keys[group_idx] for keys in level['keys']]
+                label_cells = [Paragraph(f"<b>{key_values[0]}</b>", custom_style)]
+                label_cells += [Paragraph(f"{value}", custom_style) for value in key_values[1:]]
+                label_cells[-1] = Paragraph(f"<b>{key_values[-1]} Total</b>", custom_style)
+                values = [level['measures'][name][group_idx] for name in names]
+                yield StyledRow(self.build_measure_row(label_cells, values, measures, column_count, custom_style),
+                                self.subtotal_style_commands(subtotal_config, depth))
+
+    def subtotal_style_commands(self, subtotal_config, depth):
+        styles = subtotal_config['styles']
+        style = styles[min(depth, len(styles) - 1)]
+        commands = [('BACKGROUND', (0, 0), (-1, 0), colors.HexColor(style.get('background', '#E8EEF4')))]
+        if style.get('line_color'):
+            commands.append(('LINEABOVE', (0, 0), (-1, 0), 0.75, colors.HexColor(style['line_color'])))
+        return commands
+
+    def build_summary_rows(self, aggregates, measures, levels, column_count, custom_style):
+        """
+        Grand total row, then one row per group of each level.
+
+        Group keys fill the leading columns and the measures the trailing ones.
+        """
+        measures = GroupedAggregator.normalize_measures(measures)
+        names = [measure['name'] for measure in measures]
+
+        def summary_row(label_cells, values):
+            return self.build_measure_row(label_cells, values, measures, column_count, custom_style)
+
+        totals = aggregates['total']
+        summary_rows = [summary_row([Paragraph('<b>Grand Total</b>', custom_style)],
+                                    [totals[name] for name in names])]
+
+        for level in levels:
+            level_result = aggregates['levels'].get(tuple(level))
+            if level_result is None:
+                continue
+            keys = level_result['keys']
+            measure_arrays = [level_result['measures'][name] for name in names]
+            for group_idx in range(len(keys[0]) if keys else 0):
+                label_cells = [Paragraph(f"<b>{keys[0][group_idx]}</b>", custom_style)]
+                label_cells += [Paragraph(f"{key_values[group_idx]}", custom_style) for key_values in keys[1:]]
+                summary_rows.append(summary_row(label_cells, [values[group_idx] for values in measure_arrays]))
+        return summary_rows
+
+    def get_filter_masks(self, df):
+        """Return the filter mask cache for df, starting a new one when the frame changes."""
+        if self.filter_masks is None or self.filter_masks.df is not df:
+            self.filter_masks = FilterMaskCache(df, use_index=self.filter_column_index)
+        return self.filter_masks
 
     def register_bookmark(self, title):
         """Register a bookmark for the TOC."""
         self.bookmarks[title] = len(self.bookmarks) + 1
 
     def apply_filter(self, df, column, condition):
-        """ Apply filters based on the condition. """
-        if isinstance(condition, list):
-            # Handle list of values for inclusion
-            return df[df[column].isin(condition)]
-        elif isinstance(condition, str):
-            # Check for numeric comparison
-            match = re.match(r'([<>]=?)\s*(\d+(\.\d+)?)', condition)
-            if match:
-                operator, value = match.groups()[0:2]
-                value = float(value)  # Convert value to float for comparison
-                if operator == '>':
-                    return df[df[column] > value]
-                elif operator == '<':
-                    return df[df[column] < value]
-                elif operator == '>=':
-                    return df[df[column] >= value]
-                elif operator == '<=':
-                    return df[df[column] <= value]
-                elif operator == '==':
-                    return df[df[column] == value]
-            else:
-                # Direct equality for string and non-list values
-                return df[df[column] == condition]
-        return df
+        """ Apply filters based on the condition (see FilterExpression for the grammar). """
+        if self.filter_masks is not None and self.filter_masks.df is df:
+            # The loaded frame is indexed, so use the cached per-column lookups
+            term = FilterMaskCache.canonical_term(column, condition)
+            if term is not None:
+                return df[self.filter_masks.term_mask(term)]
+            return df
+        expression = FilterExpression.compile(condition)
+        if expression is None:
+            return df
+        return df[expression.mask(df, column)]
 
 # ... [Keep your FlagManager class and other classes unchanged] ...
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
     # Example configuration setup
     config = {
         "common": {"effective_date": "2025-03-02"},
@@ -867,9 +1045,9 @@ if __name__ == "__main__":
     # Load sample data
     try:
         # Try to load sample data from CSV if available
-        sample_data_path = "sample_data.csv"
+        sample_data_path = config["common"].get("input_path", "sample_data.csv")
         if os.path.exists(sample_data_path):
-            df = pd.read_csv(sample_data_path)
+            df = ReportDataLoader(config, ExtractCache.from_config(config["common"])).load(sample_data_path)
             print(f"Loaded sample data with {len(df)} rows")
         else:
             # Create dummy data if no CSV is available
@@ -0,0 +1,78 @@
+"""
+Cold-start import benchmark for the report engine modules.
+
+Each module is imported in a fresh interpreter, after the libraries every report run
+needs anyway (pandas, numpy, ReportLab), so the time measured is what the module itself
+adds on top of them. The fastest of several runs is compared against a budget, and the
+run fails if importing the module pulls in a dependency that should only load on first
+use (Jinja2, PyPDF2, ...).
+
+Usage:
+    python import_benchmark.py [--runs 5] [--budget 0.08] [module ...]
+
+Exits with status 1 when a module is over budget or loads a deferred dependency.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+DEFAULT_MODULES = ["report_generator", "enhanced_report_generator"]
+
+# Needed by every report run, so they're imported before the clock starts
+REQUIRED_IMPORTS = ["numpy", "pandas", "reportlab.platypus", "reportlab.lib.styles"]
+
+# Loaded on first use only: templates, PDF merging, YAML configs, parallel rendering, DB access
+DEFERRED_IMPORTS = ["jinja2", "PyPDF2", "pdfkit", "yaml", "concurrent.futures.process", "psycopg2"]
+
+CHILD_SCRIPT = """
+import importlib, json, sys, time
+for name in {required!r}:
+    importlib.import_module(name)
+start = time.perf_counter()
+importlib.import_module({module!r})
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "deferred": [name for name in {deferred!r} if name in sys.modules]}}))
+"""
+
+
+def measure(module, runs):
+    """Fastest of runs cold imports of module, and the deferred modules it loaded."""
+    script = CHILD_SCRIPT.format(required=REQUIRED_IMPORTS, module=module, deferred=DEFERRED_IMPORTS)
+    src_dir = os.path.dirname(os.path.abspath(__file__))
+    best = None
+    deferred = set()
+    for _ in range(runs):
+        completed = subprocess.run([sys.executable, "-c", script], cwd=src_dir,
+                                   capture_output=True, text=True, check=True)
+        result = json.loads(completed.stdout.strip().splitlines()[-1])
+        best = result["seconds"] if best is None else min(best, result["seconds"])
+        deferred.update(result["deferred"])
+    return best, sorted(deferred)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the cold-start import time of the report engine.")
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per module (default: 5)")
+    parser.add_argument("--budget", type=float, default=0.08,
+                        help="seconds a module may add on top of its required imports (default: 0.08)")
+    args = parser.parse_args(argv)
+
+    failed = False
+    for module in args.modules:
+        seconds, deferred = measure(module, args.runs)
+        status = "ok"
+        if seconds > args.budget:
+            status = f"over budget ({args.budget:.3f}s)"
+            failed = True
+        if deferred:
+            status = f"loads {', '.join(deferred)} at import"
+            failed = True
+        print(f"{module}: {seconds:.3f}s {status}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,4 @@
 import pandas as pd
-import yaml
 from reportlab.platypus.tables import TableStyle
 from reportlab.lib.pagesizes import A4, letter, landscape
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Table, Image
@@ -8,30 +7,28 @@ from reportlab.lib.units import inch, cm
 from reportlab.lib import colors
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from jinja2 import Environment, FileSystemLoader, select_autoescape
-from PyPDF2 import PdfReader, PdfWriter
-import pdfkit
 import io
 import re
-import datetime
 from datetime import datetime
 import os
+import shutil
 import tempfile
+import time
 import logging
-import math
-from reportlab.platypus.doctemplate import PageTemplate, BaseDocTemplate
-from reportlab.platypus.frames import Frame
-from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+import hashlib
+import json
+import csv
+import queue
+import threading
+import atexit
 from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
-from reportlab.lib.utils import simpleSplit
 import numpy as np
 import subprocess
+from collections import OrderedDict, deque
 from io import BytesIO
-from reportlab.lib.pagesizes import A4
 
-# Set up logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+# Jinja2 is imported when a template is first rendered, PyPDF2 when PDFs are merged,
+# so runs that need neither don't pay for them at import time
 logger = logging.getLogger(__name__)
 
 # Custom TableOfContents class
@@ -89,21 +86,23 @@ class ReportEngine:
         self.styles = getSampleStyleSheet()
         self._setup_styles()
         
-        # Flag manager for data processing
+        # Flag manager for data processing; flagged records are written in batches per run
         self.flag_manager = FlagManager(config.get("flag_rules", []))
+        self.flag_sink = FlagSink.from_config(db_cursor, config.get("common", {}))
+        self.flag_manager.db_cursor = db_cursor
+        self.flag_manager.flag_sink = self.flag_sink
+
+        # Columnar cell formatting for table data
+        self.cell_formatter = CellFormatter()
+
+        # Paragraph styles shared by every table
+        self.style_registry = StyleRegistry()
         
         # Initialize wkhtmltopdf path
         self.wkhtmltopdf_path = config.get("wkhtmltopdf_path", None)
         
-        # Initialize Jinja2 environment for templates
-        self.jinja_env = Environment(
-            loader=FileSystemLoader("templates"),
-            autoescape=select_autoescape(['html', 'xml'])
-        )
-        
-        # Register custom filters
-        self.jinja_env.filters['format_date'] = self._format_date
-        self.jinja_env.filters['format_number'] = self._format_number
+        # Jinja2 environment for templates, created on first use
+        self._jinja_env = None
         
         try:
             # Validate required configuration
@@ -112,6 +111,22 @@ class ReportEngine:
             
             self.common = self.config.get("common", {})
             
+            # Tables with more data rows than this are laid out chunk by chunk
+            self.streaming_row_threshold = self.common.get("streaming_row_threshold", 1000)
+            
+            # Rendered front pages are reused across reports with the same cover HTML
+            self.front_page_cache = FrontPageCache.from_config(self.common)
+            
+            # Filter masks and column indexes for the DataFrame currently being reported on
+            self.filter_column_index = self.common.get("filter_column_index", True)
+            self.filter_masks = None
+            
+            # Rows of the current DataFrame grouped by section, built once per frame
+            self.partitions = None
+            
+            # Section filters stored in the database, loaded once per report
+            self.filter_criteria_store = FilterCriteriaStore.from_config(db_cursor, self.common)
+            
             # Validate required config sections
             if not self.reports:
                 raise ValueError("Missing 'reports' section in configuration")
@@ -120,6 +135,10 @@ class ReportEngine:
             self.current_page_number = 1  # Track current page number
             self.toc_page_numbers = {}  # Dictionary to store section titles and their page numbers
             self.mapping_dict = {}
+            self.mapping_index = None
+            
+            # Entity mappings are reused from a local snapshot until the table changes
+            self.mapping_snapshot = MappingSnapshot.from_config(self.common)
             
             # Initialize previous business line and sub team name
             self.previous_business_line = None
@@ -207,6 +226,19 @@ class ReportEngine:
                 alignment=TA_LEFT
             ))
 
+    @property
+    def jinja_env(self):
+        """Jinja2 environment for the templates directory, with the report's custom filters."""
+        if self._jinja_env is None:
+            from jinja2 import Environment, FileSystemLoader, select_autoescape
+            self._jinja_env = Environment(
+                loader=FileSystemLoader("templates"),
+                autoescape=select_autoescape(['html', 'xml'])
+            )
+            self._jinja_env.filters['format_date'] = self._format_date
+            self._jinja_env.filters['format_number'] = self._format_number
+        return self._jinja_env
+
     def render_front_page(self, effective_date):
         """ Render the first page using Jinja2 and convert it to PDF. """
         try:
@@ -215,6 +247,7 @@ class ReportEngine:
             if not os.path.exists(templates_dir):
                 os.makedirs(templates_dir)
             
+            from jinja2 import Environment, FileSystemLoader
             env = Environment(loader=FileSystemLoader(templates_dir))
             try:
                 template = env.get_template("front_page.html")
@@ -240,17 +273,20 @@ class ReportEngine:
                 "effective_date": effective_date
             })
             
-            # Use a temporary file with proper cleanup
-            with tempfile.NamedTemporaryFile(mode='w', suffix='.html', delete=False) as temp_file:
-                temp_file.write(html_content)
-                temp_file_name = temp_file.name
+            # The cover only depends on the rendered HTML, so reuse an earlier conversion
+            converter = self.get_html_converter()
+            cache_key = self.front_page_cache.key_for(html_content, converter.command)
+            pdf_content = self.front_page_cache.get(cache_key)
+            if pdf_content is not None:
+                return pdf_content
             
             try:
-                # Try to convert HTML to PDF using pdfkit
-                pdf_content = pdfkit.from_file(temp_file_name, False)
+                # Convert through the warm wkhtmltopdf pool, HTML in on stdin and PDF out on stdout
+                pdf_content = converter.convert(html_content)
+                self.front_page_cache.put(cache_key, pdf_content)
                 return pdf_content
             except Exception as e:
-                logger.error(f"Error converting HTML to PDF with pdfkit: {str(e)}")
+                logger.error(f"Error converting HTML to PDF with wkhtmltopdf: {str(e)}")
                 logger.info("Falling back to ReportLab for front page generation")
                 return self._create_fallback_front_page(effective_date)
             
@@ -258,13 +294,16 @@ class ReportEngine:
             logger.error(f"Error rendering front page: {str(e)}")
             # Create a simple front page using ReportLab as fallback
             return self._create_fallback_front_page(effective_date)
-        finally:
-            # Clean up temporary file
-            if 'temp_file_name' in locals() and os.path.exists(temp_file_name):
-                try:
-                    os.remove(temp_file_name)
-                except Exception as e:
-                    logger.warning(f"Error cleaning up temporary file: {str(e)}")
+
+    def get_html_converter(self, options=None):
+        """Return the shared wkhtmltopdf pool for this engine's executable and the given options."""
+        return HtmlToPdfConverter.shared(
+            self.wkhtmltopdf_path or "wkhtmltopdf",
+            options,
+            pool_size=self.common.get("html_converter_pool_size", 2),
+            timeout=self.common.get("html_converter_timeout", 30),
+            acquire_timeout=self.common.get("html_converter_acquire_timeout", 5)
+        )
     
     def _create_fallback_front_page(self, effective_date):
         """Create a simple front page using ReportLab when wkhtmltopdf is not available."""
@@ -368,27 +407,32 @@ class ReportEngine:
         doc.build(elements)
         return buffer.getvalue()
 
-    def combine_pdfs(self, pdf_front, pdf_report):
-        """ Combine front page and report PDFs with proper error handling. """
+    def combine_pdfs(self, pdf_front, pdf_report, output=None):
+        """
+        Put the first page of pdf_front in front of the report and write the combined PDF.
+
+        Args:
+            pdf_front (bytes): Front page PDF
+            pdf_report (bytes or str): Report PDF as bytes or a file path
+            output: Path or writable binary stream (file, socket.makefile("wb"), ...).
+                When omitted, the combined PDF is returned as bytes.
+        """
         try:
             if not isinstance(pdf_front, bytes):
                 raise ValueError("pdf_front must be of type bytes")
             
-            output_pdf = PdfWriter()
-            front_pdf_reader = PdfReader(io.BytesIO(pdf_front))
-            report_pdf_reader = PdfReader(io.BytesIO(pdf_report))
-            
-            # Add the front page
-            output_pdf.add_page(front_pdf_reader.pages[0])
+            merger = CoverPageMerger()
+            if output is None:
+                buffer = io.BytesIO()
+                merger.merge(pdf_front, pdf_report, buffer)
+                return buffer.getvalue()
             
-            # Add remaining report pages
-            for page in report_pdf_reader.pages:
-                output_pdf.add_page(page)
-            
-            # Use a temporary file for the combined PDF
-            with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as temp_file:
-                output_pdf.write(temp_file)
-                return temp_file.name
+            if isinstance(output, (str, os.PathLike)):
+                with open(output, "wb") as outfile:
+                    merger.merge(pdf_front, pdf_report, outfile)
+            else:
+                merger.merge(pdf_front, pdf_report, output)
+            return output
                 
         except Exception as e:
             logger.error(f"Error combining PDFs: {str(e)}")
@@ -399,24 +443,42 @@ class ReportEngine:
         pdf_front = self.render_front_page(effective_date)
         pdf_report = self.generate_report_pages()
         self.combine_pdfs(pdf_front, pdf_report)
+        
+        # Flagged records from the whole run are committed together
+        if self.flag_sink is not None:
+            self.flag_sink.close()
 
     def get_flagged_style(self, bg_color, text_color):
-        return ParagraphStyle(
+        return self.style_registry.get(("flagged", str(bg_color), str(text_color)), lambda: ParagraphStyle(
             name="FlaggedStyle",
             backColor=bg_color,
             textColor=text_color,
             fontName="Helvetica-Bold",
             fontSize=7
-        )
+        ))
 
     def get_custom_style(self):
-        styles = getSampleStyleSheet()
-        custom_style = styles["BodyText"]
+        return self.style_registry.get("custom_body", self._build_custom_style)
+
+    def _build_custom_style(self):
+        # Derive from BodyText rather than changing the shared stylesheet entry
+        custom_style = ParagraphStyle(name="CustomBodyText", parent=self.styles["BodyText"])
         custom_style.wordwrap = "CJK"
         custom_style.fontSize = 8  # Set a smaller font size
         custom_style.leading = 10
         return custom_style
 
+    def get_table_cell_style(self, header=False):
+        """Shared cell style for create_table; centred for the header row, left aligned for data."""
+        alignment = TA_CENTER if header else TA_LEFT
+        return self.style_registry.get(("table_cell", alignment), lambda: ParagraphStyle(
+            name='Normal',
+            fontName='Helvetica',
+            fontSize=9,
+            leading=12,
+            alignment=alignment
+        ))
+
     def prepare_table_data(self, report_column_info, dataframe, group_colors):
         custom_style = self.get_custom_style()
         header_row = []
@@ -432,9 +494,8 @@ class ReportEngine:
 
         table_data = [header_row]
 
-        for _, row in dataframe.iterrows():
-            data_row = [Paragraph(str(row[col_info["column"]]), custom_style) for col_info in report_column_info]
-            table_data.append(data_row)
+        for data_row in self.cell_formatter.format_rows(dataframe, report_column_info):
+            table_data.append([PlainTextCell.for_text(cell_value, custom_style) for cell_value in data_row])
 
         return table_data, header_styles
 
@@ -486,25 +547,32 @@ class ReportEngine:
                         col_widths = max_widths
         
         # Process data to ensure text wrapping
-        processed_data = []
-        for row in data:
+        header_style = self.get_table_cell_style(header=True)
+        body_style = self.get_table_cell_style()
+        cell_padding = 12  # LEFTPADDING + RIGHTPADDING from create_table_style
+
+        def process_row(row, style):
             processed_row = []
             for i, cell in enumerate(row):
                 if i < len(col_widths):  # Ensure we don't exceed column widths
                     if isinstance(cell, str):
-                        # Create a Paragraph with proper text wrapping
-                        cell_width = col_widths[i]
-                        style = ParagraphStyle(
-                            name='Normal',
-                            fontName='Helvetica',
-                            fontSize=9,
-                            leading=12,
-                            alignment=1 if row == data[0] else 0  # Center for header, left for data
-                        )
-                        processed_row.append(Paragraph(cell, style))
+                        # Plain values are drawn directly, anything needing wrapping gets a Paragraph
+                        processed_row.append(PlainTextCell.for_text(cell, style, col_widths[i] - cell_padding))
                     else:
                         processed_row.append(cell)
-            processed_data.append(processed_row)
+            return processed_row
+
+        # Large tables are laid out page by page instead of as one KeepTogether block
+        if len(data) - 1 > self.streaming_row_threshold:
+            return StreamingTable(
+                [process_row(data[0], header_style)],
+                (process_row(row, body_style) for row in data[1:]),
+                style_commands=table_style.getCommands(),
+                col_widths=col_widths
+            )
+
+        processed_data = [process_row(row, header_style if row_idx == 0 else body_style)  # Center for header, left for data
+                          for row_idx, row in enumerate(data)]
         
         # Create the table with calculated column widths
         table = Table(processed_data, colWidths=col_widths)
@@ -609,8 +677,11 @@ class ReportEngine:
         # Get current page number
         page_num = getattr(doc, 'current_page', getattr(doc, 'page', 1))
         
+        # Section parts rendered on their own get their page numbers stamped later
+        defer_page_numbers = getattr(doc, 'defer_page_numbers', False)
+        
         # Add header (except on first page which has the title)
-        if page_num > 1:
+        if page_num > 1 or defer_page_numbers:
             # Set font for header
             canvas.setFont('Helvetica-Bold', 10)
             
@@ -634,8 +705,9 @@ class ReportEngine:
         canvas.line(doc.leftMargin, 15, doc.width + doc.leftMargin, 15)
         
         # Draw page number at bottom left
-        page_text = f"Page {page_num}"
-        canvas.drawString(doc.leftMargin, 7, page_text)
+        if not defer_page_numbers:
+            page_text = f"Page {page_num}"
+            canvas.drawString(doc.leftMargin, 7, page_text)
         
         # Draw report date at bottom center
         date_text = f"Generated: {current_date}"
@@ -648,39 +720,42 @@ class ReportEngine:
         # Restore canvas state
         canvas.restoreState()
 
+    def get_filter_masks(self, df):
+        """Return the filter mask cache for df, starting a new one when the frame changes."""
+        if self.filter_masks is None or self.filter_masks.df is not df:
+            self.filter_masks = FilterMaskCache(df, use_index=self.filter_column_index)
+        return self.filter_masks
+
+    def get_partitions(self, df, keys):
+        """Return the section partitions of df, partitioning again when the frame or keys change."""
+        keys = tuple(keys)
+        if self.partitions is None or self.partitions.df is not df or self.partitions.keys != keys:
+            self.partitions = FramePartitions(df, keys)
+        return self.partitions
+
     def apply_filter(self, df, column, condition):
-        """ Apply filters based on the condition. """
-        if isinstance(condition, list):
-            # Handle list of values for inclusion
-            return df[df[column].isin(condition)]
-        elif isinstance(condition, str):
-            # Check for numeric comparison
-            match = re.match(r'([<>]=?)\s*(\d+(\.\d+)?)', condition)
-            if match:
-                operator, value = match.groups()
-                value = float(value)  # Convert value to float for comparison
-                if operator == '>':
-                    return df[df[column] > value]
-                elif operator == '<':
-                    return df[df[column] < value]
-                elif operator == '>=':
-                    return df[df[column] >= value]
-                elif operator == '<=':
-                    return df[df[column] <= value]
-                elif operator == '==':
-                    return df[df[column] == value]
-            else:
-                # Direct equality for string and non-list values
-                return df[df[column] == condition]
+        """ Apply filters based on the condition (see FilterExpression for the grammar). """
+        if self.filter_masks is not None and self.filter_masks.df is df:
+            # The loaded frame is indexed, so use the cached per-column lookups
+            term = FilterMaskCache.canonical_term(column, condition)
+            if term is not None:
+                return df[self.filter_masks.term_mask(term)]
+            return df
+        expression = FilterExpression.compile(condition)
+        if expression is None:
+            return df
+        return df[expression.mask(df, column)]
 
     def fetch_filter_criteria_from_db(self, report_name, section_name):
-        query = """
-        SELECT COLUMN_NAME, OPERATOR, CONDITION, IS_LIST
-        FROM mera_db.BOOK_CONF_FILTER_CRITERIA
-        WHERE REPORT_NAME = '{report_name}' AND TABLE_NAME = '{section_name}'
         """
-        result = self.db_cursor.get_df(query.format(report_name=report_name, section_name=section_name))
-        return result
+        Filter criteria for one section from BOOK_CONF_FILTER_CRITERIA.
+
+        All sections of the report are loaded with one query and cached (see FilterCriteriaStore).
+
+        Returns:
+            dict: {column: FilterExpression}, usable as filter_criteria
+        """
+        return self.filter_criteria_store.get(report_name, section_name)
 
     def after_flowable(self, flowable):
         """ Method to register TOC entries and track page numbers. """
@@ -742,44 +817,86 @@ class ReportEngine:
         return elements
 
     def fetch_mapping_data(self):
-        """ Fetch the mapping data from the database """
+        """
+        Fetch the mapping data from the database.
+
+        A local snapshot is used instead while it is fresh and the table's probe is unchanged.
+
+        Returns:
+            dict: {TYPE: {FULL_NAME: SHORT_NAME}}
+        """
+        snapshot = self.mapping_snapshot
+        probe = snapshot.probe(self.db_cursor) if snapshot else None
+        if snapshot:
+            mapping_dict = snapshot.load(probe)
+            if mapping_dict is not None:
+                return mapping_dict
+
         mapping_query = "SELECT FULL_NAME, SHORT_NAME, TYPE FROM mera_db.BOOK.ENTITY_MAPPING"
         mapping_df = self.db_cursor.get_df(mapping_query)
 
         # Convert the mapping data into a dictionary organized by type
-        mapping_dict = {}
-        for _, row in mapping_df.iterrows():
-            mapping_type = row["TYPE"]
-            if mapping_type not in mapping_dict:
-                mapping_dict[mapping_type] = {}
-            mapping_dict[mapping_type][row["FULL_NAME"]] = row["SHORT_NAME"]
+        mapping_dict = {
+            mapping_type: dict(zip(group["FULL_NAME"], group["SHORT_NAME"]))
+            for mapping_type, group in mapping_df.groupby("TYPE", sort=False)
+        }
 
+        if snapshot:
+            snapshot.save(mapping_dict, probe)
         return mapping_dict
 
+    def get_mapping_index(self):
+        """Return the MappingIndex for self.mapping_dict, rebuilding it when the mappings are replaced."""
+        if self.mapping_index is None or self.mapping_index.mapping_dict is not self.mapping_dict:
+            self.mapping_index = MappingIndex(self.mapping_dict)
+        return self.mapping_index
+
     def apply_mapping(self, value, mapping_type):
         """ Ensure value is a scalar """
         if isinstance(value, pd.Series):
             value = value.iloc[0]
 
-        # Apply the mapping based on the type
-        if mapping_type == "FUND_NAME":
-            # Check for multi-word mappings first
-            for long_name, short_name in self.mapping_dict[mapping_type].items():
-                if long_name in value:
-                    value = value.replace(long_name, short_name)
-
-            # Split the fund name into words and replace each word with its shorter version if a mapping exists
-            words = value.split()
-            mapped_words = [self.mapping_dict[mapping_type].get(word, word) for word in words]
-            return " ".join(mapped_words)
-        else:
-            # Direct replacement for other types
-            for type_dict in self.mapping_dict.values():
-                if value in type_dict:
-                    return type_dict[value]
+        # Full names are replaced in one automaton pass, other types are a single dict lookup
+        return self.get_mapping_index().map_value(value, mapping_type)
+
+    def map_column(self, series, mapping_type):
+        """Apply the mapping for mapping_type to every value of a Series at once."""
+        return self.get_mapping_index().map_column(series, mapping_type)
+
+    def generate_pdf_report(self, data, output_path, single_pass=True, workers=None):
+        """
+        Generate a PDF report with the provided data.
+
+        Args:
+            data (dict): Structured section data from process_data
+            output_path (str): Path of the PDF to write
+            single_pass (bool): Lay the story out once and fill in TOC page numbers at the end.
+                When False, the document is built twice and the TOC uses the first pass's page map.
+            workers (int): Render sections in this many processes; defaults to common.render_workers
+        """
+        if workers is None:
+            workers = self.common.get("render_workers", 1)
+        if workers > 1 and len(data) > 1:
+            return self.generate_pdf_report_parallel(data, output_path, workers)
+
+        if single_pass:
+            doc = SinglePassDocTemplate(
+                output_path,
+                pagesize=self.page_size,
+                leftMargin=self.left_margin,
+                rightMargin=self.right_margin,
+                topMargin=self.top_margin,
+                bottomMargin=self.bottom_margin,
+                title=self.title,
+                author=self.author,
+                subject=self.subject,
+                creator=self.creator,
+                producer=self.producer,
+                on_page=self.on_page
+            )
+            self.build_document(data, doc)
+            return output_path
 
-    def generate_pdf_report(self, data, output_path):
-        """Generate a PDF report with the provided data."""
         # First pass - collect page numbers for TOC
         buffer = BytesIO()
         first_pass_doc = FirstPassDocTemplate(
@@ -877,65 +994,30 @@ class ReportEngine:
         story.append(toc_title)
         
         # Add TOC entries placeholder
-        if isinstance(doc_template, FirstPassDocTemplate):
+        if isinstance(doc_template, SinglePassDocTemplate):
+            # Single pass - entries are laid out now, page numbers are drawn when the build finishes
+            toc_style = ParagraphStyle(
+                'TOCEntry',
+                parent=self.styles['Normal'],
+                fontSize=11,
+                leading=16,
+            )
+            for section in data.keys():
+                form_name = doc_template.register_page_reference(section)
+                story.append(DeferredTOCEntry(section, form_name, toc_style, leftIndent=0.5*cm))
+                story.append(Spacer(1, 0.2*cm))
+        elif isinstance(doc_template, FirstPassDocTemplate):
             # First pass - just collect page numbers
             story.append(Spacer(1, 2*cm))
         else:
             # Second pass - add actual TOC with page numbers
-            toc_entries = []
-            for section, page_num in doc_template.section_page_map.items():
-                # Create TOC entry with dot leaders
-                dots = "." * (50 - len(section) - len(str(page_num)))
-                toc_text = f'{section} {dots} {page_num}'
-                toc_style = ParagraphStyle(
-                    'TOCEntry',
-                    parent=self.styles['Normal'],
-                    fontSize=11,
-                    leading=16,
-                    leftIndent=0.5*cm,
-                    firstLineIndent=-0.5*cm,
-                )
-                toc_entry = Paragraph(toc_text, toc_style)
-                toc_entries.append(toc_entry)
-                toc_entries.append(Spacer(1, 0.2*cm))
-            
-            story.extend(toc_entries)
+            story.extend(self.build_toc_entries(doc_template.section_page_map))
         
         story.append(PageBreak())
         
         # Process each section
         for section_name, section_data in data.items():
-            # Add section header
-            section_header = Paragraph(section_name, self.styles["Heading1"])
-            story.append(section_header)
-            
-            # Track section for TOC
-            story.append(Spacer(1, 0.5*cm))
-            
-            # Process tables in the section
-            for table_data in section_data:
-                if "title" in table_data:
-                    # Add table title
-                    table_title = Paragraph(table_data["title"], self.styles["Heading2"])
-                    story.append(table_title)
-                    story.append(Spacer(1, 0.3*cm))
-                
-                if "description" in table_data:
-                    # Add table description
-                    table_desc = Paragraph(table_data["description"], self.styles["Normal"])
-                    story.append(table_desc)
-                    story.append(Spacer(1, 0.3*cm))
-                
-                if "data" in table_data:
-                    # Create and add table
-                    table = self.create_table(
-                        table_data["data"],
-                        style_config=table_data.get("style", {}),
-                        col_widths=table_data.get("col_widths", None)
-                    )
-                    if table:
-                        story.append(table)
-                        story.append(Spacer(1, 0.5*cm))
+            story.extend(self.build_section_story(section_name, section_data))
             
             # Add page break after each section
             story.append(PageBreak())
@@ -949,20 +1031,227 @@ class ReportEngine:
         
         return doc_template
 
+    def build_toc_entries(self, section_page_map):
+        """Build TOC paragraphs with dot leaders from a section -> page number map."""
+        toc_entries = []
+        for section, page_num in section_page_map.items():
+            # Create TOC entry with dot leaders
+            dots = "." * (50 - len(section) - len(str(page_num)))
+            toc_text = f'{section} {dots} {page_num}'
+            toc_style = ParagraphStyle(
+                'TOCEntry',
+                parent=self.styles['Normal'],
+                fontSize=11,
+                leading=16,
+                leftIndent=0.5*cm,
+                firstLineIndent=-0.5*cm,
+            )
+            toc_entry = Paragraph(toc_text, toc_style)
+            toc_entries.append(toc_entry)
+            toc_entries.append(Spacer(1, 0.2*cm))
+        return toc_entries
+
+    def build_section_story(self, section_name, section_data):
+        """Build the flowables for one section: its heading followed by its tables."""
+        story = []
+        
+        # Add section header
+        section_header = Paragraph(section_name, self.styles["Heading1"])
+        story.append(section_header)
+        
+        # Track section for TOC
+        story.append(Spacer(1, 0.5*cm))
+        
+        # Process tables in the section
+        for table_data in section_data:
+            if "title" in table_data:
+                # Add table title
+                table_title = Paragraph(table_data["title"], self.styles["Heading2"])
+                story.append(table_title)
+                story.append(Spacer(1, 0.3*cm))
+            
+            if "description" in table_data:
+                # Add table description
+                table_desc = Paragraph(table_data["description"], self.styles["Normal"])
+                story.append(table_desc)
+                story.append(Spacer(1, 0.3*cm))
+            
+            if "data" in table_data:
+                # Create and add table
+                table = self.create_table(
+                    table_data["data"],
+                    style_config=table_data.get("style", {}),
+                    col_widths=table_data.get("col_widths", None)
+                )
+                if table:
+                    story.append(table)
+                    story.append(Spacer(1, 0.5*cm))
+        
+        return story
+
+    def render_section_pdf(self, section_name, section_data):
+        """
+        Render one section to its own PDF.
+
+        Page numbers are left off the footer because the section's final position is only
+        known once every section has been rendered; generate_pdf_report_parallel stamps them.
+
+        Returns:
+            tuple: (pdf bytes, page count)
+        """
+        buffer = BytesIO()
+        doc = SimpleDocTemplate(
+            buffer,
+            pagesize=self.page_size,
+            leftMargin=self.left_margin,
+            rightMargin=self.right_margin,
+            topMargin=self.top_margin,
+            bottomMargin=self.bottom_margin
+        )
+        doc.defer_page_numbers = True
+        
+        story = self.build_section_story(section_name, section_data)
+        doc.build(story, onFirstPage=self.on_page, onLaterPages=self.on_page)
+        
+        return buffer.getvalue(), doc.page
+
+    def render_front_matter(self, section_page_map):
+        """Render the front page and TOC; returns (pdf bytes, page count)."""
+        buffer = BytesIO()
+        doc = SimpleDocTemplate(
+            buffer,
+            pagesize=self.page_size,
+            leftMargin=self.left_margin,
+            rightMargin=self.right_margin,
+            topMargin=self.top_margin,
+            bottomMargin=self.bottom_margin
+        )
+        
+        story = []
+        front_page = self.create_front_page()
+        if front_page:
+            story.append(front_page)
+            story.append(PageBreak())
+        story.append(Paragraph("Table of Contents", self.styles["Heading1"]))
+        story.extend(self.build_toc_entries(section_page_map))
+        
+        doc.build(story, onFirstPage=self.on_page, onLaterPages=self.on_page)
+        return buffer.getvalue(), doc.page
+
+    def generate_pdf_report_parallel(self, data, output_path, workers):
+        """
+        Render each section in its own process and stitch the parts in order.
+
+        Sections are independent, so each worker renders one section PDF with its headers and
+        footers. The parent then renders the front page and TOC from the workers' page counts,
+        concatenates everything, stamps the final page numbers and adds an outline entry per section.
+        Set common.render_workers (or pass workers) to use this mode.
+        """
+        from concurrent.futures import ProcessPoolExecutor
+        from PyPDF2 import PdfReader, PdfWriter
+        from PyPDF2.generic import DictionaryObject, NameObject
+        
+        payloads = [(self.config, self.env, section_name, section_data)
+                    for section_name, section_data in data.items()]
+        
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            section_parts = list(executor.map(_render_section_worker, payloads))
+        
+        # The TOC length does not depend on the page numbers it shows, so this
+        # settles after one extra render at most
+        front_page_count = 2
+        while True:
+            section_page_map = {}
+            next_page = front_page_count + 1
+            for (section_name, _), (_, page_count) in zip(data.items(), section_parts):
+                section_page_map[section_name] = next_page
+                next_page += page_count
+            
+            front_pdf, rendered_count = self.render_front_matter(section_page_map)
+            if rendered_count == front_page_count:
+                break
+            front_page_count = rendered_count
+        
+        writer = PdfWriter()
+        for page in PdfReader(io.BytesIO(front_pdf)).pages:
+            writer.add_page(page)
+        
+        # Page numbers are appended as a small extra content stream on each page,
+        # which avoids re-parsing the section's own page content
+        page_number_font = writer._add_object(DictionaryObject({
+            NameObject("/Type"): NameObject("/Font"),
+            NameObject("/Subtype"): NameObject("/Type1"),
+            NameObject("/BaseFont"): NameObject("/Helvetica"),
+            NameObject("/Encoding"): NameObject("/WinAnsiEncoding"),
+        }))
+        
+        for (section_name, _), (section_pdf, page_count) in zip(data.items(), section_parts):
+            start_page = section_page_map[section_name]
+            for page_num, page in enumerate(PdfReader(io.BytesIO(section_pdf)).pages, start_page):
+                page = writer.add_page(page)
+                self._stamp_page_number(writer, page, page_num, page_number_font)
+            writer.add_outline_item(section_name, start_page - 1)
+        
+        writer.add_metadata({
+            "/Title": self.title,
+            "/Author": self.author,
+            "/Subject": self.subject,
+            "/Creator": self.creator,
+            "/Producer": self.producer
+        })
+        with open(output_path, "wb") as outfile:
+            writer.write(outfile)
+        
+        return output_path
+
+    def _stamp_page_number(self, writer, page, page_num, font_ref):
+        """Draw the footer page number on a stitched page, matching on_page."""
+        from PyPDF2.generic import ArrayObject, DecodedStreamObject, DictionaryObject, NameObject
+        
+        resources = page[NameObject("/Resources")].get_object()
+        if NameObject("/Font") not in resources:
+            resources[NameObject("/Font")] = DictionaryObject()
+        resources[NameObject("/Font")].get_object()[NameObject("/FPageNo")] = font_ref
+        
+        # Wrap the existing content in q/Q so the stamp starts from a clean graphics state
+        save_state = DecodedStreamObject()
+        save_state.set_data(b"q\n")
+        stamp = DecodedStreamObject()
+        stamp.set_data(f"\nQ\nBT /FPageNo 8 Tf {self.left_margin:.2f} 7 Td (Page {page_num}) Tj ET\n".encode("latin-1"))
+        
+        contents = page.get(NameObject("/Contents"))
+        if contents is None:
+            existing = []
+        elif isinstance(contents.get_object(), ArrayObject):
+            existing = list(contents.get_object())
+        else:
+            existing = [contents]
+        page[NameObject("/Contents")] = ArrayObject(
+            [writer._add_object(save_state)] + existing + [writer._add_object(stamp)])
+
     def process_data(self, df, report_config):
-        """Process DataFrame data into the format needed for document building."""
+        """
+        Process DataFrame data into the format needed for document building.
+
+        Rows are partitioned by "section" plus any report_config["partition_by"] keys
+        once; a section may narrow its rows with a {"partition": {key: value}} mapping.
+        """
         structured_data = {}
         
         # Get sections from report configuration
         sections = report_config.get("sections", [])
         
+        # Group the rows by section (and any extra partition keys) once for all sections
+        partition_by = ["section"] + [key for key in report_config.get("partition_by", []) if key != "section"]
+        partitions = self.get_partitions(df, partition_by)
+        
         for section in sections:
             section_name = section.get("section_name", "")
             title = section.get("title", section_name)
             description = section.get("description", "")
             
-            # Filter data for this section
-            section_data = df[df["section"] == section_name]
+            # Slice this section's rows out of the partitioned frame
+            section_data = partitions.select({"section": section_name, **section.get("partition", {})})
             
             # Initialize section in structured data if not exists
             if title not in structured_data:
@@ -975,7 +1264,6 @@ class ReportEngine:
                 continue
             
             # Extract column names and widths
-            column_names = [col.get("name") for col in columns]
             column_display_names = [col.get("display_name", col.get("name")) for col in columns]
             relative_widths = [col.get("width", 1) for col in columns]
             
@@ -1000,26 +1288,8 @@ class ReportEngine:
                 structured_data[title].append(table_info)
                 continue
             
-            # Add data rows
-            for _, row in section_data.iterrows():
-                data_row = []
-                for col_name in column_names:
-                    # Get cell value, handling missing columns
-                    if col_name in row:
-                        cell_value = row[col_name]
-                        # Format the cell value if needed
-                        if pd.isna(cell_value):
-                            cell_value = ""
-                        elif isinstance(cell_value, float):
-                            cell_value = f"{cell_value:.2f}"
-                        elif isinstance(cell_value, (int, np.integer)):
-                            cell_value = str(cell_value)
-                        elif not isinstance(cell_value, str):
-                            cell_value = str(cell_value)
-                    else:
-                        cell_value = ""
-                    data_row.append(cell_value)
-                table_data.append(data_row)
+            # Add data rows, formatted column by column
+            table_data.extend(self.cell_formatter.format_rows(section_data, columns))
             
             # Get table style from section config
             table_style_config = section.get("table_style", {})
@@ -1068,21 +1338,16 @@ class ReportEngine:
                     company=self.reports.get("company", "Risk Management")
                 )
                 
-                # Create temporary HTML file
-                with tempfile.NamedTemporaryFile(suffix=".html", delete=False) as temp_html:
-                    temp_html.write(html_content.encode('utf-8'))
-                    temp_html_path = temp_html.name
-                
-                # Convert HTML to PDF using wkhtmltopdf
-                temp_pdf_path = temp_html_path.replace('.html', '.pdf')
-                subprocess.run([self.wkhtmltopdf_path, temp_html_path, temp_pdf_path], check=True)
+                converter = self.get_html_converter()
+                cache_key = self.front_page_cache.key_for(html_content, converter.command)
+                pdf_content = self.front_page_cache.get(cache_key)
+                if pdf_content is None:
+                    # Convert HTML to PDF using wkhtmltopdf
+                    pdf_content = converter.convert(html_content)
+                    self.front_page_cache.put(cache_key, pdf_content)
                 
                 # Read the PDF and return as Image
-                img = Image(temp_pdf_path, width=self.page_width, height=self.page_height)
-                
-                # Clean up temporary files
-                os.remove(temp_html_path)
-                os.remove(temp_pdf_path)
+                img = Image(io.BytesIO(pdf_content), width=self.page_width, height=self.page_height)
                 
                 return img
             
@@ -1139,132 +1404,2552 @@ class ReportEngine:
         
         return KeepTogether(elements)
 
-class FlagManager:
-    def __init__(self, flag_rules):
-        """Initialize FlagManager with validation of flag rules."""
-        try:
-            if not isinstance(flag_rules, dict):
-                raise ValueError("flag_rules must be a dictionary")
-            
-            # Store flag rules
-            self.flag_rules = flag_rules
-            
-            # For backward compatibility with the original format
-            for category, rules in flag_rules.items():
-                if isinstance(rules, list):
-                    for rule in rules:
-                        # Check if rule has required fields
-                        if 'conditions' not in rule:
-                            rule['conditions'] = []
-                            # Create a condition from field, operator, value if available
-                            if all(k in rule for k in ['field', 'operator', 'value']):
-                                rule['conditions'].append({
-                                    'field': rule['field'],
-                                    'operator': rule['operator'],
-                                    'value': rule['value']
-                                })
-                        
-                        # Set default values for missing fields
-                        if 'name' not in rule:
-                            rule['name'] = f"Rule for {category}"
-                        if 'flag_color' not in rule and 'color' not in rule:
-                            rule['flag_color'] = "#ffcccc"
-                        if 'text_color' not in rule:
-                            rule['text_color'] = "#000000"
-            
-            logger.info(f"FlagManager initialized with {len(flag_rules)} rule categories")
-            
-        except Exception as e:
-            logger.error(f"Error initializing FlagManager: {str(e)}")
-            raise
+class PlainTextCell(Flowable):
+    """
+    A single-line table cell drawn with drawString.
 
-    def evaluate_conditions(self, row, conditions):
-        """Evaluate conditions with proper error handling and validation."""
-        try:
-            if not conditions:
-                return False
-                
-            for condition in conditions:
-                field = condition.get("field")
-                operator = condition.get("operator")
-                value = condition.get("value")
-                
-                if not all([field, operator]):
-                    logger.warning(f"Missing required condition fields: {condition}")
-                    continue
-                
-                # Skip if field is not in the row
-                if field not in row:
-                    logger.warning(f"Field '{field}' not found in row")
-                    continue
-                
-                # Get field value from row
-                field_value = row[field]
-                
-                # Skip evaluation if field value is NaN or None
-                if pd.isna(field_value):
-                    continue
-                
-                # Evaluate the condition
-                result = self._evaluate_operator(field_value, operator, value)
-                
-                # If any condition is false, return false (AND logic)
-                if not result:
-                    return False
-            
-            # All conditions passed
-            return True
-            
-        except Exception as e:
-            logger.error(f"Error evaluating conditions: {str(e)}")
-            return False
+    Used in place of a Paragraph for values with no markup that fit their column,
+    so tables skip paragraph parsing and line breaking for plain values like "1234.56".
+    """
+    MARKUP_PATTERN = re.compile(r"[<>&\n\t]|\s{2}")
 
-    def _evaluate_expression(self, expression, row):
-        """Safely evaluate a mathematical expression using row values."""
-        try:
-            # Create a safe dict with only the row values
-            safe_dict = dict(row)
-            # Add some safe mathematical functions
-            safe_dict.update({
-                'abs': abs,
-                'round': round,
-                'max': max,
-                'min': min
-            })
-            return eval(expression, {"__builtins__": {}}, safe_dict)
-        except Exception as e:
-            logger.error(f"Error evaluating expression {expression}: {str(e)}")
-            raise
+    def __init__(self, text, style, text_width=None):
+        Flowable.__init__(self)
+        self.text = text
+        self.style = style
+        if text_width is None:
+            text_width = pdfmetrics.stringWidth(text, style.fontName, style.fontSize)
+        self.text_width = text_width
+        self.width = text_width
+        self.height = style.leading
 
-    def _evaluate_operator(self, field_value, operator, value):
-        """Evaluate a comparison operator."""
-        try:
-            # Convert value to appropriate type if needed
-            if isinstance(field_value, (int, float)) and isinstance(value, str):
-                try:
-                    value = float(value)
-                except ValueError:
-                    pass
-            
-            # Handle different operators
-            if operator == ">":
-                return field_value > value
-            elif operator == "<":
-                return field_value < value
-            elif operator == "==":
-                return field_value == value
-            elif operator == "!=":
-                return field_value != value
-            elif operator == ">=":
-                return field_value >= value
-            elif operator == "<=":
-                return field_value <= value
-            elif operator.lower() == "contains":
-                return str(value).lower() in str(field_value).lower()
-            elif operator.lower() == "startswith":
-                return str(field_value).lower().startswith(str(value).lower())
-            elif operator.lower() == "endswith":
-                return str(field_value).lower().endswith(str(value).lower())
+    @classmethod
+    def for_text(cls, text, style, max_width=None):
+        """
+        Return a PlainTextCell for text when it can be drawn on one line, otherwise a Paragraph.
+
+        Args:
+            text (str): Cell text
+            style (ParagraphStyle): Style the cell should look like
+            max_width (float): Usable column width, or None when the column is sized to its content
+        """
+        text = str(text)
+        if cls.MARKUP_PATTERN.search(text):
+            return Paragraph(text, style)
+
+        text = text.strip()
+        if max_width is None:
+            # Without a known column width only values that cannot wrap are safe to draw on one line
+            if " " in text:
+                return Paragraph(text, style)
+            return cls(text, style)
+
+        text_width = pdfmetrics.stringWidth(text, style.fontName, style.fontSize)
+        if text_width > max_width:
+            return Paragraph(text, style)
+        return cls(text, style, text_width)
+
+    def minWidth(self):
+        return self.text_width
+
+    def getPlainText(self):
+        return self.text
+
+    def wrap(self, availWidth, availHeight):
+        self.width = availWidth
+        return (self.width, self.height)
+
+    def draw(self):
+        canvas = self.canv
+        style = self.style
+
+        if style.backColor:
+            canvas.setFillColor(style.backColor)
+            canvas.rect(0, 0, self.width, self.height, stroke=0, fill=1)
+
+        canvas.setFillColor(style.textColor)
+        canvas.setFont(style.fontName, style.fontSize)
+        baseline = self.height - style.fontSize
+        if style.alignment == TA_CENTER:
+            canvas.drawCentredString(self.width / 2.0, baseline, self.text)
+        elif style.alignment == TA_RIGHT:
+            canvas.drawRightString(self.width, baseline, self.text)
+        else:
+            canvas.drawString(0, baseline, self.text)
+
+class StyledRow(list):
+    """
+    A table row that carries style commands for itself.
+
+    Commands use row 0 for the row, e.g. ('BACKGROUND', (0, 0), (-1, 0), color); tables
+    move them to wherever the row is placed.
+    """
+    def __init__(self, cells, style_commands=()):
+        list.__init__(self, cells)
+        self.style_commands = list(style_commands)
+
+    def commands_at(self, row_idx):
+        return [(name, (start[0], row_idx), (end[0], row_idx)) + tuple(rest)
+                for name, start, end, *rest in self.style_commands]
+
+class StreamingTable(Flowable):
+    """
+    A table that pulls its rows from an iterator and lays out one page-sized Table at a time.
+
+    The header rows are repeated on every chunk, and only the rows of the chunk being laid
+    out are held in memory, so peak memory does not grow with the number of rows.
+    """
+    def __init__(self, header_rows, rows, style_commands=None, col_widths=None,
+                 cell_factory=None, alt_row_color=None, initial_chunk_rows=50):
+        """
+        Args:
+            header_rows (list): Header rows repeated at the top of every chunk
+            rows (iterable): Data rows, consumed lazily; StyledRow rows keep their own styling
+            style_commands (list): Table style commands; row indices refer to the chunk, so
+                they should only target header rows or whole ranges like (0, 1), (-1, -1)
+            col_widths (list): Column widths passed to each chunk
+            cell_factory (callable): Turns a raw row value into a cell when the row is pulled
+            alt_row_color (Color): Background for every other data row, counted across chunks
+            initial_chunk_rows (int): Rows to try in the first chunk before a row height is known
+        """
+        Flowable.__init__(self)
+        self.header_rows = header_rows
+        self.rows = iter(rows)
+        self.style_commands = list(style_commands or [])
+        self.col_widths = col_widths
+        self.cell_factory = cell_factory
+        self.alt_row_color = alt_row_color
+        self.chunk_rows = initial_chunk_rows
+
+        self._pending = deque()
+        self._rows_emitted = 0
+        self._chunks_emitted = 0
+        self._row_height = None
+
+    def _pull(self, count):
+        """Take up to count rows, pending rows first."""
+        taken = []
+        while self._pending and len(taken) < count:
+            taken.append(self._pending.popleft())
+        while len(taken) < count:
+            try:
+                row = next(self.rows)
+            except StopIteration:
+                break
+            if self.cell_factory is not None:
+                cells = [self.cell_factory(value) for value in row]
+                row = StyledRow(cells, row.style_commands) if isinstance(row, StyledRow) else cells
+            taken.append(row)
+        return taken
+
+    def _has_more(self):
+        if self._pending:
+            return True
+        more = self._pull(1)
+        self._pending.extend(more)
+        return bool(more)
+
+    def _make_table(self, rows):
+        header_count = len(self.header_rows)
+        commands = list(self.style_commands)
+        if self.alt_row_color is not None:
+            for offset in range(len(rows)):
+                if (self._rows_emitted + offset) % 2 == 0:
+                    row_idx = header_count + offset
+                    commands.append(('BACKGROUND', (0, row_idx), (-1, row_idx), self.alt_row_color))
+        for offset, row in enumerate(rows):
+            if isinstance(row, StyledRow):
+                commands.extend(row.commands_at(header_count + offset))
+
+        table = Table(self.header_rows + rows, colWidths=self.col_widths, repeatRows=header_count)
+        table.setStyle(TableStyle(commands))
+        return table
+
+    def _rows_for_height(self, availHeight):
+        if self._row_height is None:
+            return self.chunk_rows
+        # Aim slightly high so a chunk fills the frame and Table.split trims the overflow
+        return max(1, int(availHeight / self._row_height * 1.1) + 1)
+
+    def _next_chunk(self, availWidth, availHeight):
+        """Build the next Table that fits in availHeight, or None if not even one row fits."""
+        rows = self._pull(self._rows_for_height(availHeight))
+        if not rows and self._chunks_emitted:
+            return None
+
+        table = self._make_table(rows)
+        _, height = table.wrap(availWidth, availHeight)
+        if rows:
+            header_height = sum(table._rowHeights[:len(self.header_rows)])
+            self._row_height = max((height - header_height) / len(rows), 1)
+
+        if height > availHeight:
+            parts = table.split(availWidth, availHeight)
+            kept = len(parts[0]._cellvalues) - len(self.header_rows) if len(parts) > 1 else 0
+            if kept <= 0:
+                self._pending.extendleft(reversed(rows))
+                return None
+            self._pending.extendleft(reversed(rows[kept:]))
+            rows = rows[:kept]
+            table = self._make_table(rows)
+
+        self._rows_emitted += len(rows)
+        self._chunks_emitted += 1
+        return table
+
+    def wrap(self, availWidth, availHeight):
+        # Ask for more room than is available so the frame always splits us into chunks
+        self.width = availWidth
+        self.height = availHeight + 1
+        return (self.width, self.height)
+
+    def split(self, availWidth, availHeight):
+        chunk = self._next_chunk(availWidth, availHeight)
+        if chunk is None:
+            return []
+        # The doc template marks flowables it had to move to the next frame; we are never
+        # drawn ourselves, so clear the mark once a chunk has been placed
+        self.__dict__.pop('_postponed', None)
+        if self._has_more():
+            return [chunk, self]
+        return [chunk]
+
+    def draw(self):
+        # Only the chunks returned by split are ever drawn
+        pass
+
+class ConverterUnavailable(RuntimeError):
+    """Raised when the HTML converter pool is saturated, broken or a job fails."""
+
+class HtmlToPdfConverter:
+    """
+    Bounded pool of pre-started wkhtmltopdf processes.
+
+    Each process is started ahead of time with "-" as input and output, so its startup cost
+    is paid while it waits on stdin. A job writes the HTML to stdin, reads the PDF from stdout
+    and, if the idle pool is short, a single background thread tops it up; processes are
+    started outside the lock, so jobs can take idle ones meanwhile. Jobs time out individually; when
+    every slot is busy or the converter keeps failing, convert raises ConverterUnavailable so
+    the caller can fall back to a ReportLab cover.
+    """
+    _shared = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, executable, options=None, pool_size=2, timeout=30, acquire_timeout=5, max_failures=3):
+        self.executable = executable
+        self.options = dict(options or {})
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.acquire_timeout = acquire_timeout
+        self.max_failures = max_failures
+        self.command = self._build_command()
+
+        self._slots = threading.BoundedSemaphore(pool_size)
+        self._lock = threading.Lock()
+        self._idle = deque()
+        self._failures = 0
+        self._replenishing = False
+        self._closed = False
+
+    @classmethod
+    def shared(cls, executable, options=None, **kwargs):
+        """Return the process-wide pool for an executable and option set."""
+        key = (executable, tuple(sorted((options or {}).items())))
+        with cls._shared_lock:
+            if key not in cls._shared:
+                cls._shared[key] = cls(executable, options, **kwargs)
+            return cls._shared[key]
+
+    @classmethod
+    def close_all(cls):
+        with cls._shared_lock:
+            for converter in cls._shared.values():
+                converter.close()
+            cls._shared.clear()
+
+    def _build_command(self):
+        command = [self.executable, "--quiet"]
+        for option, value in self.options.items():
+            command.append(f"--{option}")
+            if value not in ("", None):
+                command.append(str(value))
+        # Read HTML from stdin and write the PDF to stdout
+        command.extend(["-", "-"])
+        return command
+
+    @property
+    def broken(self):
+        return self._failures >= self.max_failures
+
+    def _spawn(self):
+        return subprocess.Popen(self.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def _take_idle(self):
+        with self._lock:
+            while self._idle:
+                process = self._idle.popleft()
+                if process.poll() is None:
+                    return process
+        return None
+
+    def _record_failure(self, disable=False):
+        with self._lock:
+            self._failures = self.max_failures if disable else self._failures + 1
+
+    def _record_success(self):
+        with self._lock:
+            self._failures = 0
+
+    def _start_replenish(self):
+        """Start the replenishing thread unless the idle pool is full or one is already running."""
+        with self._lock:
+            if (self._replenishing or self._closed or self.broken
+                    or len(self._idle) >= self.pool_size):
+                return
+            self._replenishing = True
+        threading.Thread(target=self._replenish, daemon=True).start()
+
+    def _replenish(self):
+        """Start processes until pool_size are waiting for work."""
+        while True:
+            with self._lock:
+                if self._closed or self.broken or len(self._idle) >= self.pool_size:
+                    self._replenishing = False
+                    return
+            try:
+                process = self._spawn()
+            except OSError as e:
+                logger.warning(f"Could not start {self.executable}: {str(e)}")
+                with self._lock:
+                    self._failures = self.max_failures
+                    self._replenishing = False
+                return
+            with self._lock:
+                if not self._closed:
+                    self._idle.append(process)
+                    continue
+            # Closed while the process was starting
+            process.kill()
+            process.communicate()
+
+    def convert(self, html_content):
+        """Convert an HTML string to PDF bytes."""
+        if self.broken:
+            raise ConverterUnavailable(f"{self.executable} failed {self._failures} times in a row")
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            raise ConverterUnavailable("All HTML converter workers are busy")
+
+        try:
+            process = self._take_idle()
+            if process is None:
+                try:
+                    process = self._spawn()
+                except OSError as e:
+                    self._record_failure(disable=True)
+                    raise ConverterUnavailable(f"Could not start {self.executable}: {str(e)}")
+
+            try:
+                pdf_content, error_output = process.communicate(html_content.encode("utf-8"), timeout=self.timeout)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.communicate()
+                self._record_failure()
+                raise ConverterUnavailable(f"HTML conversion timed out after {self.timeout}s")
+
+            if process.returncode != 0 or not pdf_content.startswith(b"%PDF"):
+                self._record_failure()
+                raise ConverterUnavailable(
+                    f"{self.executable} exited with {process.returncode}: {error_output.decode('utf-8', 'replace')[:200]}")
+
+            self._record_success()
+            return pdf_content
+        finally:
+            self._slots.release()
+            self._start_replenish()
+
+    def close(self):
+        """Stop the idle processes and any further replenishing."""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = list(self._idle), deque()
+        for process in idle:
+            if process.poll() is None:
+                process.kill()
+                process.communicate()
+
+atexit.register(HtmlToPdfConverter.close_all)
+
+class CoverPageMerger:
+    """
+    Puts a cover page in front of a PDF by appending an incremental update.
+
+    The report body is copied to the output byte for byte; only its trailer and page tree
+    root are read. The cover page and the objects it uses are appended under new object
+    numbers, the page tree root is rewritten with the cover as its first kid, and a new
+    cross-reference section points back to the body's. Bodies that use cross-reference
+    streams are merged with a full PdfWriter rewrite instead.
+    """
+    INHERITABLE_KEYS = ("/Resources", "/MediaBox", "/CropBox", "/Rotate")
+    COPY_CHUNK_SIZE = 1024 * 1024
+
+    def merge(self, pdf_front, pdf_report, output):
+        """
+        Args:
+            pdf_front (bytes): PDF whose first page becomes the cover
+            pdf_report (bytes or str): Report body as bytes or a file path
+            output: Writable binary stream (file, socket.makefile("wb"), ...)
+        """
+        from PyPDF2 import PdfReader
+
+        front_page = PdfReader(io.BytesIO(pdf_front)).pages[0]
+
+        if isinstance(pdf_report, (bytes, bytearray)):
+            body_stream = io.BytesIO(pdf_report)
+            body_size = len(pdf_report)
+        else:
+            body_stream = open(pdf_report, "rb")
+            body_size = os.path.getsize(pdf_report)
+
+        try:
+            start_xref = self._find_start_xref(body_stream, body_size)
+            body_stream.seek(start_xref)
+            if body_stream.read(4) != b"xref":
+                logger.info("Report body uses cross-reference streams, rewriting it in full")
+                body_stream.seek(0)
+                self._rewrite(front_page, PdfReader(body_stream), output)
+                return
+
+            body_stream.seek(0)
+            body_reader = PdfReader(body_stream)
+
+            # Copy the body through unchanged
+            body_stream.seek(0)
+            shutil.copyfileobj(body_stream, output, self.COPY_CHUNK_SIZE)
+            self._append_cover(front_page, body_reader, body_size, start_xref, output)
+        finally:
+            body_stream.close()
+
+    def _find_start_xref(self, stream, size):
+        stream.seek(max(0, size - 1024))
+        tail = stream.read()
+        marker = tail.rfind(b"startxref")
+        if marker < 0:
+            raise ValueError("Report PDF has no startxref")
+        return int(tail[marker + len(b"startxref"):].split()[0])
+
+    def _rewrite(self, front_page, body_reader, output):
+        from PyPDF2 import PdfWriter
+
+        writer = PdfWriter()
+        writer.add_page(front_page)
+        for page in body_reader.pages:
+            writer.add_page(page)
+        writer.write(output)
+
+    def _append_cover(self, front_page, body_reader, body_size, start_xref, output):
+        from PyPDF2.generic import ArrayObject, DictionaryObject, IndirectObject, NameObject, NumberObject
+
+        trailer = body_reader.trailer
+        catalog = trailer["/Root"]
+        pages_ref = catalog.raw_get("/Pages")
+        pages_root = pages_ref.get_object()
+
+        self._next_number = int(trailer["/Size"])
+        self._numbers = {}
+        self._pending = []
+        offsets = {}
+        position = body_size
+
+        def write_object(number, generation, obj):
+            nonlocal position
+            buffer = BytesIO()
+            buffer.write(f"\n{number} {generation} obj\n".encode("latin-1"))
+            obj.write_to_stream(buffer, None)
+            buffer.write(b"\nendobj\n")
+            offsets[number] = (position + 1, generation)
+            data = buffer.getvalue()
+            output.write(data)
+            position += len(data)
+
+        # The cover page, with inherited attributes made explicit and its parent set to the body's root
+        cover_number = self._allocate()
+        cover = DictionaryObject()
+        for key, value in front_page.items():
+            if key != "/Parent":
+                cover[NameObject(key)] = self._copy(value)
+        for key in self.INHERITABLE_KEYS:
+            if key not in cover:
+                inherited = self._inherited(front_page, key)
+                if inherited is not None:
+                    cover[NameObject(key)] = self._copy(inherited)
+        cover[NameObject("/Parent")] = pages_ref
+        write_object(cover_number, 0, cover)
+
+        # Everything the cover refers to
+        while self._pending:
+            source_ref, number = self._pending.pop()
+            write_object(number, 0, self._copy(source_ref.get_object()))
+
+        # Rewrite the page tree root with the cover first; body references keep their numbers
+        new_root = DictionaryObject()
+        for key, value in pages_root.items():
+            new_root[NameObject(key)] = value
+        new_root[NameObject("/Kids")] = ArrayObject(
+            [IndirectObject(cover_number, 0, None)] + list(pages_root.raw_get("/Kids")))
+        new_root[NameObject("/Count")] = NumberObject(int(pages_root["/Count"]) + 1)
+        write_object(pages_ref.idnum, pages_ref.generation, new_root)
+
+        # Cross-reference section for the appended objects
+        xref_position = position + 1
+        lines = [b"\nxref\n0 1\n0000000000 65535 f\r\n"]
+        numbers = sorted(offsets)
+        run_start = 0
+        for idx in range(1, len(numbers) + 1):
+            if idx == len(numbers) or numbers[idx] != numbers[idx - 1] + 1:
+                run = numbers[run_start:idx]
+                lines.append(f"{run[0]} {len(run)}\n".encode("latin-1"))
+                for number in run:
+                    offset, generation = offsets[number]
+                    lines.append(f"{offset:010d} {generation:05d} n\r\n".encode("latin-1"))
+                run_start = idx
+        output.write(b"".join(lines))
+
+        new_trailer = DictionaryObject()
+        for key, value in trailer.items():
+            if key not in ("/Prev", "/Size", "/XRefStm"):
+                new_trailer[NameObject(key)] = value
+        new_trailer[NameObject("/Size")] = NumberObject(self._next_number)
+        new_trailer[NameObject("/Prev")] = NumberObject(start_xref)
+        trailer_buffer = BytesIO()
+        trailer_buffer.write(b"trailer\n")
+        new_trailer.write_to_stream(trailer_buffer, None)
+        trailer_buffer.write(f"\nstartxref\n{xref_position}\n%%EOF\n".encode("latin-1"))
+        output.write(trailer_buffer.getvalue())
+
+    def _allocate(self):
+        number = self._next_number
+        self._next_number += 1
+        return number
+
+    def _inherited(self, page, key):
+        node = page.get("/Parent")
+        while node is not None:
+            node = node.get_object()
+            if key in node:
+                return node.raw_get(key)
+            node = node.get("/Parent")
+        return None
+
+    def _copy(self, obj):
+        """Copy a cover object, renumbering the indirect objects it refers to."""
+        from PyPDF2.generic import ArrayObject, DictionaryObject, IndirectObject, NameObject, StreamObject
+
+        if isinstance(obj, IndirectObject):
+            key = (obj.idnum, obj.generation)
+            if key not in self._numbers:
+                self._numbers[key] = self._allocate()
+                self._pending.append((obj, self._numbers[key]))
+            return IndirectObject(self._numbers[key], 0, None)
+        if isinstance(obj, StreamObject):
+            copy = type(obj)()
+            copy._data = obj._data
+            for key, value in obj.items():
+                if key != "/Length":
+                    copy[NameObject(key)] = self._copy(value)
+            return copy
+        if isinstance(obj, DictionaryObject):
+            copy = DictionaryObject()
+            for key, value in obj.items():
+                copy[NameObject(key)] = self._copy(value)
+            return copy
+        if isinstance(obj, ArrayObject):
+            return ArrayObject([self._copy(value) for value in obj])
+        return obj
+
+class FrontPageCache:
+    """
+    Content-addressed cache of rendered front page PDFs.
+
+    Entries are keyed by a hash of the rendered cover HTML (plus the converter settings) and
+    kept in memory and, when a directory is configured, on disk. The default directory is
+    private to the current user, so only this user's report processes share it; it is
+    trimmed least-recently-used first once it exceeds max_bytes.
+    """
+    _shared = {}
+
+    def __init__(self, cache_dir=None, max_bytes=256 * 1024 * 1024, max_memory_entries=32):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_memory_entries = max_memory_entries
+        self._memory = OrderedDict()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    @classmethod
+    def from_config(cls, common):
+        """
+        Return the process-wide cache for the configured directory.
+
+        Reads common.front_page_cache_dir (set it to an empty value for memory only; the
+        default is front_pages/ in a private per-user temp directory) and
+        common.front_page_cache_max_mb. Falls back to memory only if the directory can't be used.
+        """
+        max_bytes = int(common.get("front_page_cache_max_mb", 256) * 1024 * 1024)
+        try:
+            cache_dir = common.get("front_page_cache_dir")
+            if cache_dir is None:
+                cache_dir = os.path.join(_private_cache_dir("report_cache"), "front_pages")
+            key = (cache_dir, max_bytes)
+            if key not in cls._shared:
+                cls._shared[key] = cls(cache_dir, max_bytes)
+        except OSError as e:
+            logger.warning(f"Front page disk cache disabled: {str(e)}")
+            key = (None, max_bytes)
+            if key not in cls._shared:
+                cls._shared[key] = cls(None, max_bytes)
+        return cls._shared[key]
+
+    def key_for(self, html_content, *settings):
+        digest = hashlib.sha256(html_content.encode("utf-8"))
+        for setting in settings:
+            digest.update(b"\0" + repr(setting).encode("utf-8"))
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.pdf")
+
+    def get(self, key):
+        """Return the cached PDF bytes for key, or None."""
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return self._memory[key]
+
+        if not self.cache_dir:
+            return None
+
+        path = self._path(key)
+        try:
+            with open(path, "rb") as cached_file:
+                pdf_content = cached_file.read()
+            # Touch the file so eviction sees it as recently used
+            os.utime(path)
+        except OSError:
+            return None
+
+        self._remember(key, pdf_content)
+        return pdf_content
+
+    def put(self, key, pdf_content):
+        """Store PDF bytes under key in memory and on disk."""
+        if not pdf_content:
+            return
+        self._remember(key, pdf_content)
+
+        if not self.cache_dir:
+            return
+        try:
+            # Write to a temporary name first so readers never see a partial file
+            with tempfile.NamedTemporaryFile(dir=self.cache_dir, suffix=".tmp", delete=False) as temp_file:
+                temp_file.write(pdf_content)
+            os.replace(temp_file.name, self._path(key))
+            self._evict()
+        except OSError as e:
+            logger.warning(f"Error writing front page cache entry: {str(e)}")
+
+    def _remember(self, key, pdf_content):
+        self._memory[key] = pdf_content
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _evict(self):
+        """Remove least recently used files until the directory fits in max_bytes."""
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".pdf"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total_size -= size
+            except OSError:
+                pass
+
+class StyleRegistry:
+    """Builds each ParagraphStyle once and hands out the shared instance by key."""
+    def __init__(self):
+        self._styles = {}
+
+    def get(self, key, factory):
+        """Return the style registered under key, building it with factory on first use."""
+        style = self._styles.get(key)
+        if style is None:
+            style = factory()
+            self._styles[key] = style
+        return style
+
+    def __contains__(self, key):
+        return key in self._styles
+
+    def __len__(self):
+        return len(self._styles)
+
+class CellFormatter:
+    """
+    Turns DataFrame columns into table cell strings one column at a time.
+
+    Column specs come from the section config (report_columns_info / columns) and may set:
+        precision (int): Decimal places for float values (default 2)
+        format (str): A Python format spec such as ",.2f" that overrides precision
+        na_value (str): Text used for missing values (default "")
+    """
+    def __init__(self, default_precision=2, na_value=""):
+        self.default_precision = default_precision
+        self.na_value = na_value
+
+    def format_column(self, series, spec=None):
+        """Format a whole Series into an object array of display strings."""
+        spec = spec or {}
+        fmt = spec.get("format")
+        precision = spec.get("precision", self.default_precision)
+        na_value = spec.get("na_value", self.na_value)
+        missing = series.isna().to_numpy()
+
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            # Dictionary-encoded columns are decoded here, formatting each category once
+            formatted_categories = self.format_column(pd.Series(series.cat.categories), spec)
+            codes = series.cat.codes.to_numpy()
+            formatted = np.asarray(formatted_categories, dtype=object)[np.where(codes >= 0, codes, 0)] \
+                if len(formatted_categories) else np.full(len(series), na_value, dtype=object)
+        elif pd.api.types.is_bool_dtype(series):
+            formatted = series.astype(str).to_numpy(dtype=object)
+        elif pd.api.types.is_float_dtype(series):
+            values = series.to_numpy(dtype=float, na_value=np.nan)
+            if fmt:
+                formatted = np.array([format(value, fmt) for value in values], dtype=object)
+            else:
+                formatted = np.char.mod(f"%.{precision}f", values).astype(object)
+        elif pd.api.types.is_integer_dtype(series):
+            if fmt:
+                formatted = np.array([format(value, fmt) if not is_missing else na_value
+                                      for value, is_missing in zip(series.to_numpy(dtype=object), missing)],
+                                     dtype=object)
+            else:
+                formatted = series.astype(str).to_numpy(dtype=object)
+        else:
+            # Mixed or non-numeric columns still need a per-value type check
+            formatted = np.array([self.format_value(value, fmt, precision) for value in series.to_numpy(dtype=object)],
+                                 dtype=object)
+
+        if missing.any():
+            formatted[missing] = na_value
+        return formatted
+
+    def format_value(self, value, fmt=None, precision=None):
+        """Format a single value the same way format_column formats a column."""
+        if precision is None:
+            precision = self.default_precision
+        if isinstance(value, (float, np.floating)):
+            return format(value, fmt) if fmt else f"{value:.{precision}f}"
+        if fmt and isinstance(value, (int, np.integer)) and not isinstance(value, (bool, np.bool_)):
+            return format(value, fmt)
+        return str(value)
+
+    def format_rows(self, df, column_specs):
+        """
+        Format the configured columns of df and zip them into row lists.
+
+        Columns missing from df are filled with the spec's na_value.
+        """
+        row_count = len(df)
+        formatted_columns = []
+        for spec in column_specs:
+            column_name = spec.get("name", spec.get("column", ""))
+            if column_name in df.columns:
+                formatted_columns.append(self.format_column(df[column_name], spec))
+            else:
+                formatted_columns.append([spec.get("na_value", self.na_value)] * row_count)
+
+        if not formatted_columns:
+            return [[] for _ in range(row_count)]
+        return [list(row) for row in zip(*formatted_columns)]
+
+    def iter_rows(self, df, column_specs, batch_size=1000):
+        """Yield formatted rows lazily, formatting batch_size rows at a time."""
+        for start in range(0, len(df), batch_size):
+            yield from self.format_rows(df.iloc[start:start + batch_size], column_specs)
+
+class ColumnIndex:
+    """
+    Lazily built per-column row indexes over one DataFrame.
+
+    The first equality or isin lookup on a column factorizes it once into a value ->
+    positions map; later lookups are dict hits and unions of positional arrays. The
+    first numeric comparison on a column sorts its non-null values once; later ones
+    are a binary search.
+    """
+    def __init__(self, df):
+        self.df = df
+        self._value_positions = {}
+        self._null_positions = {}
+        self._sorted = {}
+
+    def _positions_by_value(self, column):
+        positions = self._value_positions.get(column)
+        if positions is None:
+            codes, uniques = pd.factorize(self.df[column], use_na_sentinel=True)
+            order = np.argsort(codes, kind="stable")
+            counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+            null_count = len(codes) - int(counts.sum())
+            # Nulls (code -1) sort first; the rest split into one run per unique value
+            groups = np.split(order[null_count:], np.cumsum(counts)[:-1]) if len(uniques) else []
+            positions = dict(zip(uniques, groups))
+            self._value_positions[column] = positions
+            self._null_positions[column] = np.sort(order[:null_count])
+        return positions
+
+    def _sorted_values(self, column):
+        entry = self._sorted.get(column)
+        if entry is None:
+            values = self.df[column].to_numpy(dtype=float, na_value=np.nan)
+            valid = np.flatnonzero(~np.isnan(values))
+            order = valid[np.argsort(values[valid], kind="stable")]
+            entry = (values[order], order)
+            self._sorted[column] = entry
+        return entry
+
+    def isin_positions(self, column, values):
+        """Row positions whose value is one of values (nulls match a null in values, as with isin)."""
+        positions = self._positions_by_value(column)
+        found = [positions[value] for value in values if value in positions]
+        if any(pd.isna(value) for value in values):
+            found.append(self._null_positions[column])
+        if not found:
+            return np.empty(0, dtype=np.intp)
+        return np.concatenate(found)
+
+    def compare_positions(self, column, operator, value):
+        """Row positions whose value satisfies "<", "<=", ">" or ">=" value; nulls never match."""
+        sorted_values, order = self._sorted_values(column)
+        if operator == ">":
+            return order[np.searchsorted(sorted_values, value, side="right"):]
+        if operator == ">=":
+            return order[np.searchsorted(sorted_values, value, side="left"):]
+        if operator == "<":
+            return order[:np.searchsorted(sorted_values, value, side="left")]
+        if operator == "<=":
+            return order[:np.searchsorted(sorted_values, value, side="right")]
+        raise ValueError(f"Unsupported comparison operator: {operator}")
+
+class FilterSyntaxError(ValueError):
+    """Raised when a filter condition can't be parsed."""
+
+class FilterExpression:
+    """
+    A filter condition compiled once into a vectorized predicate over one column.
+
+    String conditions use a small grammar (keywords are case-insensitive):
+        expr      := and_expr (OR and_expr)*
+        and_expr  := term (AND term)*
+        term      := "(" expr ")" | predicate
+        predicate := op value | BETWEEN value AND value | [NOT] IN (value, ...) | IS [NOT] NULL
+        op        := = | == | != | <> | < | <= | > | >=
+        value     := number | 'quoted' | "quoted" | YYYY-MM-DD[ HH:MM[:SS]] | bare words
+    e.g. "between -5 and 10", "> 2024-01-01 AND IS NOT NULL", "not in ('A', 'B')".
+
+    A string the grammar doesn't parse in full ("In Progress", "(Legacy) Fund", "O'Brien")
+    is a literal equality with the whole string, as before. Lists mean IN, other scalars mean equality and None doesn't filter.
+    Nulls only match IS NULL. Compiled expressions are cached by condition.
+    """
+    KEYWORDS = {"AND", "OR", "NOT", "IN", "IS", "NULL", "BETWEEN"}
+    COMPARISONS = {"=": "==", "==": "==", "!=": "!=", "<>": "!=", "<": "<", "<=": "<=", ">": ">", ">=": ">="}
+    TOKEN_PATTERN = re.compile(r"""\s*(?:
+          (?P<string>'(?:[^']|'')*'|"(?:[^"]|"")*")
+        | (?P<date>\d{4}-\d{2}-\d{2}(?:[ T]\d{2}:\d{2}(?::\d{2})?)?(?![\w:.-]))
+        | (?P<number>[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?(?![\w.-]))
+        | (?P<op><=|>=|<>|!=|==|=|<|>)
+        | (?P<punct>[(),])
+        | (?P<word>[^\s(),'"<>=!]+)
+    )""", re.VERBOSE)
+
+    _cache = {}
+
+    def __init__(self, node):
+        self.node = node
+        self._predicate = self._compile(node)
+
+    def __eq__(self, other):
+        return isinstance(other, FilterExpression) and self.node == other.node
+
+    def __hash__(self):
+        return hash(self.node)
+
+    def __repr__(self):
+        return f"FilterExpression({self.node!r})"
+
+    @classmethod
+    def compile(cls, condition):
+        """
+        Compile a filter_criteria condition, reusing an earlier compilation of the same condition.
+
+        Returns:
+            FilterExpression or None: None when the condition doesn't filter
+        """
+        if condition is None or isinstance(condition, FilterExpression):
+            return condition
+        if isinstance(condition, (list, tuple, set)):
+            key = ("list", tuple(condition))
+        else:
+            key = (type(condition).__name__, condition)
+
+        expression = cls._cache.get(key)
+        if expression is None:
+            if isinstance(condition, (list, tuple, set)):
+                node = cls._in_node("in", [cls._literal_for(value) for value in condition])
+            elif isinstance(condition, str):
+                node = cls._parse(condition)
+            else:
+                node = cls._in_node("in", [cls._literal_for(condition)])
+            expression = cls(node)
+            cls._cache[key] = expression
+        return expression
+
+    @classmethod
+    def all_of(cls, expressions):
+        """AND several compiled expressions over the same column."""
+        expressions = [expression for expression in expressions if expression is not None]
+        if not expressions:
+            return None
+        if len(expressions) == 1:
+            return expressions[0]
+        return cls(("and",) + tuple(sorted({expression.node for expression in expressions}, key=repr)))
+
+    @classmethod
+    def from_criteria_row(cls, row):
+        """
+        Compile one BOOK_CONF_FILTER_CRITERIA row (COLUMN_NAME, OPERATOR, CONDITION, IS_LIST).
+
+        List rows hold comma-separated values in CONDITION; "!=", "<>" and "NOT IN" exclude them.
+
+        Returns:
+            tuple: (column_name, FilterExpression)
+        """
+        column = str(row["COLUMN_NAME"]).strip()
+        operator = str(row["OPERATOR"] or "").strip().upper()
+        condition = "" if row["CONDITION"] is None else str(row["CONDITION"]).strip()
+        is_list = str(row["IS_LIST"]).strip().upper() in ("1", "Y", "YES", "TRUE")
+
+        if is_list:
+            values = [cls._literal(value.strip()) for value in condition.split(",") if value.strip()]
+            kind = "not_in" if operator in ("!=", "<>", "NOT IN") else "in"
+            return column, cls(cls._in_node(kind, values))
+        if operator in cls.COMPARISONS:
+            # CONDITION holds a single raw value here, so don't tokenize it
+            return column, cls(("cmp", cls.COMPARISONS[operator], cls._literal(condition)))
+        if not operator:
+            return column, cls.compile(condition)
+        return column, cls.compile(f"{operator} {condition}")
+
+    def mask(self, df, column, index=None):
+        """
+        Evaluate the expression against df[column].
+
+        Args:
+            index (ColumnIndex): Optional index over df used for IN, equality and numeric range lookups
+
+        Returns:
+            numpy.ndarray: Boolean row mask
+        """
+        return self._predicate(df[column], column, index if index is not None and index.df is df else None)
+
+    # Parsing
+
+    @classmethod
+    def _tokenize(cls, text):
+        tokens = []
+        position = 0
+        text = text.strip()
+        while position < len(text):
+            match = cls.TOKEN_PATTERN.match(text, position)
+            if not match or match.end() == position:
+                raise FilterSyntaxError(f"Unexpected character at {position} in filter {text!r}")
+            position = match.end()
+            kind = match.lastgroup
+            value = match.group(kind)
+            if kind == "word" and value.upper() in cls.KEYWORDS:
+                kind, value = "keyword", value.upper()
+            tokens.append((kind, value))
+        return tokens
+
+    @classmethod
+    def _parse(cls, text):
+        # Plain values keep their old meaning: equality with the whole string
+        literal = cls._in_node("in", [(text, text)])
+        try:
+            tokens = cls._tokenize(text)
+        except FilterSyntaxError:
+            # e.g. an apostrophe in a name such as O'Brien
+            return literal
+        if not tokens or tokens[0][0] not in ("op", "keyword", "punct") or tokens[0][1] in (",", ")"):
+            return literal
+
+        try:
+            parser = _FilterParser(cls, tokens, text)
+            node = parser.parse_or()
+            if parser.position != len(tokens):
+                raise FilterSyntaxError(f"Unexpected {tokens[parser.position][1]!r} in filter {text!r}")
+        except FilterSyntaxError as e:
+            # Values such as "In Progress" or "(Legacy) Fund" only look like the grammar
+            if tokens[0][0] == "op":
+                logger.warning(f"{e}; matching the whole string as a value instead")
+            return literal
+        return node
+
+    @staticmethod
+    def _literal(text):
+        """Parse a value token into (typed value, text); typed values are float, Timestamp or str."""
+        if len(text) >= 2 and text[0] == text[-1] and text[0] in "'\"":
+            unquoted = text[1:-1].replace(text[0] * 2, text[0])
+            return (unquoted, unquoted)
+        if re.fullmatch(r"\d{4}-\d{2}-\d{2}(?:[ T]\d{2}:\d{2}(?::\d{2})?)?", text):
+            return (pd.Timestamp(text), text)
+        if re.fullmatch(r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?", text):
+            return (float(text), text)
+        return (text, text)
+
+    @staticmethod
+    def _literal_for(value):
+        """(typed value, text) for a scalar from YAML or a list condition."""
+        if isinstance(value, (bool, np.bool_)):
+            return (value, str(value))
+        if isinstance(value, (int, float, np.integer, np.floating)):
+            return (float(value), str(value))
+        if isinstance(value, (datetime, np.datetime64)):
+            return (pd.Timestamp(value), str(value))
+        return (value, value)
+
+    @staticmethod
+    def _in_node(kind, literals):
+        return (kind, tuple(sorted(set(literals), key=repr)))
+
+    # Compilation
+
+    @classmethod
+    def _compile(cls, node):
+        kind = node[0]
+        if kind in ("and", "or"):
+            parts = [cls._compile(child) for child in node[1:]]
+            combine = np.logical_and if kind == "and" else np.logical_or
+
+            def predicate(series, column, index):
+                mask = parts[0](series, column, index)
+                for part in parts[1:]:
+                    mask = combine(mask, part(series, column, index))
+                return mask
+            return predicate
+
+        if kind in ("in", "not_in"):
+            literals = node[1]
+
+            def predicate(series, column, index):
+                values = cls._values_for(series, literals)
+                if index is not None:
+                    mask = cls._positions_mask(index.isin_positions(column, values), len(series))
+                else:
+                    mask = series.isin(values).to_numpy(dtype=bool)
+                if kind == "in":
+                    return mask
+                return ~mask & series.notna().to_numpy(dtype=bool)
+            return predicate
+
+        if kind in ("null", "not_null"):
+            def predicate(series, column, index):
+                missing = series.isna().to_numpy(dtype=bool)
+                return missing if kind == "null" else ~missing
+            return predicate
+
+        if kind == "between":
+            low = cls._compile(("cmp", ">=", node[1]))
+            high = cls._compile(("cmp", "<=", node[2]))
+            return lambda series, column, index: low(series, column, index) & high(series, column, index)
+
+        if kind == "cmp":
+            operator, literal = node[1], node[2]
+            if operator in ("==", "!="):
+                return cls._compile(("in" if operator == "==" else "not_in", (literal,)))
+
+            def predicate(series, column, index):
+                if isinstance(series.dtype, pd.CategoricalDtype):
+                    # Compare the categories once and look the rows up by code
+                    categories = pd.Series(series.cat.categories)
+                    codes = series.cat.codes.to_numpy()
+                    matched = predicate(categories, None, None)
+                    return np.where(codes >= 0, matched[codes], False)
+                typed, text = literal
+                numeric = pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series)
+                if isinstance(typed, float):
+                    if index is not None and numeric:
+                        return cls._positions_mask(index.compare_positions(column, operator, typed), len(series))
+                    values = series if numeric else pd.to_numeric(series, errors="coerce")
+                elif isinstance(typed, pd.Timestamp):
+                    values = series if pd.api.types.is_datetime64_any_dtype(series) else pd.to_datetime(series, errors="coerce")
+                else:
+                    values = series
+                result = cls._OPERATIONS[operator](values, typed)
+                return result.to_numpy(dtype=bool, na_value=False) & values.notna().to_numpy(dtype=bool)
+            return predicate
+
+        raise FilterSyntaxError(f"Unknown filter node {kind!r}")
+
+    _OPERATIONS = {
+        "<": lambda values, value: values < value,
+        "<=": lambda values, value: values <= value,
+        ">": lambda values, value: values > value,
+        ">=": lambda values, value: values >= value,
+    }
+
+    @staticmethod
+    def _values_for(series, literals):
+        """Pick the typed or the text form of each literal to match the column's dtype."""
+        dtype = series.cat.categories.dtype if isinstance(series.dtype, pd.CategoricalDtype) else series.dtype
+        numeric = pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype)
+        dates = pd.api.types.is_datetime64_any_dtype(dtype)
+        mixed = pd.api.types.is_object_dtype(dtype)
+        values = []
+        for typed, text in literals:
+            if isinstance(typed, float) and mixed:
+                # Object columns can hold numbers as well as text
+                values.extend((text, typed))
+            elif isinstance(typed, float) and not numeric:
+                values.append(text)
+            elif isinstance(typed, pd.Timestamp) and not dates:
+                values.append(text)
+            else:
+                values.append(typed)
+        return values
+
+    @staticmethod
+    def _positions_mask(positions, length):
+        mask = np.zeros(length, dtype=bool)
+        mask[positions] = True
+        return mask
+
+class _FilterParser:
+    """Recursive-descent parser behind FilterExpression._parse."""
+    def __init__(self, expression_class, tokens, text):
+        self.expression_class = expression_class
+        self.tokens = tokens
+        self.text = text
+        self.position = 0
+
+    def _peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else (None, None)
+
+    def _accept(self, kind, value=None):
+        token_kind, token_value = self._peek()
+        if token_kind == kind and (value is None or token_value == value):
+            self.position += 1
+            return token_value
+        return None
+
+    def _expect(self, kind, value=None):
+        token = self._accept(kind, value)
+        if token is None:
+            found = self._peek()[1]
+            raise FilterSyntaxError(f"Expected {value or kind} but found {found!r} in filter {self.text!r}")
+        return token
+
+    def parse_or(self):
+        parts = [self.parse_and()]
+        while self._accept("keyword", "OR"):
+            parts.append(self.parse_and())
+        return parts[0] if len(parts) == 1 else ("or",) + tuple(parts)
+
+    def parse_and(self):
+        parts = [self.parse_term()]
+        while self._accept("keyword", "AND"):
+            parts.append(self.parse_term())
+        return parts[0] if len(parts) == 1 else ("and",) + tuple(parts)
+
+    def parse_term(self):
+        if self._accept("punct", "("):
+            node = self.parse_or()
+            self._expect("punct", ")")
+            return node
+
+        operator = self._accept("op")
+        if operator is not None:
+            return ("cmp", self.expression_class.COMPARISONS[operator], self.parse_value())
+        if self._accept("keyword", "BETWEEN"):
+            low = self.parse_value()
+            self._expect("keyword", "AND")
+            return ("between", low, self.parse_value())
+        if self._accept("keyword", "IS"):
+            negated = self._accept("keyword", "NOT") is not None
+            self._expect("keyword", "NULL")
+            return ("not_null",) if negated else ("null",)
+
+        negated = self._accept("keyword", "NOT") is not None
+        self._expect("keyword", "IN")
+        self._expect("punct", "(")
+        values = [self.parse_value()]
+        while self._accept("punct", ","):
+            values.append(self.parse_value())
+        self._expect("punct", ")")
+        return self.expression_class._in_node("not_in" if negated else "in", values)
+
+    def parse_value(self):
+        """A literal; consecutive bare words and numbers form one string value ("Team A")."""
+        kind, value = self._peek()
+        if kind in ("string", "date", "number", "word"):
+            self.position += 1
+            parts = [value]
+            if kind != "string":
+                while self._peek()[0] in ("word", "number", "date"):
+                    parts.append(self._peek()[1])
+                    self.position += 1
+            if len(parts) == 1:
+                return self.expression_class._literal(value)
+            joined = " ".join(parts)
+            return (joined, joined)
+        raise FilterSyntaxError(f"Expected a value but found {value!r} in filter {self.text!r}")
+
+class ReportDataLoader:
+    """
+    Reads a report's input extract, loading only the columns its config refers to.
+
+    Referenced columns come from the column specs (columns / report_columns_info),
+    filter_criteria keys, flag rule fields, aggregation and subtotal settings (including
+    GroupedAggregator's defaults for tables that don't override them), the section column
+    and, with reports.filter_criteria_from_db, the report's stored filter criteria. The config's optional schema section sets dtypes and extra columns:
+
+        schema:
+          columns:
+            MARKET_VALUE: float64
+            INVESTMENT_TEAM_NAME: category
+            AS_OF_DATE: datetime64[ns]
+          extra_columns: [NOTES]    # always loaded, e.g. for flag rule expressions
+          load_all_columns: false
+          categorical_columns: [FUND_NAME]
+          auto_categorical_ratio: 0.05
+
+    Dimension columns (listed in categorical_columns, or text columns whose distinct
+    values are at most auto_categorical_ratio of the rows) are dictionary-encoded as
+    categoricals, so filters, groupbys, flags and mappings work on integer codes and
+    strings are only decoded when cells are formatted.
+
+    CSV, Parquet (.parquet, .pq) and Arrow IPC / Feather (.arrow, .feather, .ipc) inputs
+    are supported; the columnar formats only read the needed columns from disk. With an
+    ExtractCache, CSV and Parquet inputs are converted once and memory-mapped afterwards.
+
+    Frames read from Arrow files (directly or through the cache) are views onto the mapped
+    file: numeric columns are read-only NumPy arrays, so replace whole columns rather than
+    assigning into them, or pass writable=True to load for private copies.
+    """
+    COLUMN_SPEC_KEYS = ("columns", "report_columns_info")
+    PARQUET_SUFFIXES = (".parquet", ".pq")
+    ARROW_SUFFIXES = (".arrow", ".feather", ".ipc")
+
+    def __init__(self, config, extract_cache=None, filter_criteria_store=None):
+        self.config = config
+        self.schema = config.get("schema") or {}
+        self.dtypes = dict(self.schema.get("columns") or {})
+        self.extract_cache = extract_cache
+        self.filter_criteria_store = filter_criteria_store
+
+    def referenced_columns(self):
+        """
+        Columns the report needs, in first-use order.
+
+        Returns:
+            list or None: None when every column should be loaded
+        """
+        if self.schema.get("load_all_columns"):
+            return None
+        reports = self.config.get("reports") or {}
+        columns = []
+        self._collect(reports, columns)
+        self._collect_default_aggregation(reports, columns)
+        self._collect_flag_fields(self.config.get("flag_rules") or {}, columns)
+        if reports.get("filter_criteria_from_db"):
+            if self.filter_criteria_store is None:
+                # Stored criteria may name any column
+                return None
+            report_name = reports.get("report_name", reports.get("filename"))
+            for criteria in self.filter_criteria_store.load(report_name).values():
+                columns.extend(criteria.keys())
+        columns.extend(self.schema.get("extra_columns") or [])
+        if not columns:
+            return None
+        return list(dict.fromkeys(column for column in columns if isinstance(column, str) and column))
+
+    def _collect(self, node, columns):
+        if isinstance(node, list):
+            for item in node:
+                self._collect(item, columns)
+            return
+        if not isinstance(node, dict):
+            return
+        for key, value in node.items():
+            if key in self.COLUMN_SPEC_KEYS and isinstance(value, list):
+                for spec in value:
+                    if isinstance(spec, dict):
+                        columns.append(spec.get("name", spec.get("column")))
+            elif key in ("filter_criteria", "partition") and isinstance(value, dict):
+                columns.extend(value.keys())
+            elif key == "measures" and isinstance(value, list):
+                columns.extend(measure.get("column") for measure in value if isinstance(measure, dict))
+            elif key in ("group_by", "partition_by") and isinstance(value, list):
+                columns.extend(value)
+            elif key == "levels" and isinstance(value, list):
+                for level in value:
+                    columns.extend(level if isinstance(level, list) else [level])
+            elif key == "sections" and isinstance(value, list) and any(
+                    isinstance(section, dict) and "section_name" in section for section in value):
+                # process_data picks each section's rows by the "section" column
+                columns.append("section")
+            self._collect(value, columns)
+
+    def _collect_default_aggregation(self, reports, columns):
+        """Default measure and level columns for tables whose aggregation doesn't set them."""
+        report_aggregation = reports.get("aggregation") or {}
+        needs_measures = needs_levels = False
+
+        def visit(node):
+            nonlocal needs_measures, needs_levels
+            if isinstance(node, list):
+                for item in node:
+                    visit(item)
+            elif isinstance(node, dict):
+                if "report_columns_info" in node:
+                    aggregation = node.get("aggregation", report_aggregation) or {}
+                    needs_measures = needs_measures or "measures" not in aggregation
+                    needs_levels = needs_levels or "levels" not in aggregation
+                for value in node.values():
+                    visit(value)
+
+        visit(reports)
+        if needs_measures:
+            columns.extend(measure["column"] for measure in GroupedAggregator.DEFAULT_MEASURES)
+        if needs_levels:
+            for level in GroupedAggregator.DEFAULT_LEVELS:
+                columns.extend(level)
+
+    def _collect_flag_fields(self, flag_rules, columns):
+        for rules in flag_rules.values():
+            for rule in (rules if isinstance(rules, list) else [rules]):
+                if not isinstance(rule, dict):
+                    continue
+                columns.append(rule.get("field"))
+                columns.extend(condition.get("field") for condition in rule.get("conditions") or []
+                               if isinstance(condition, dict))
+
+    def load(self, path, writable=False):
+        """
+        Load path with only the referenced columns, typed from the schema.
+
+        Args:
+            writable (bool): Copy numeric columns mapped from an Arrow file so they can be
+                assigned into in place, at the cost of a private copy per process
+        """
+        wanted = self.referenced_columns()
+        suffix = os.path.splitext(str(path))[1].lower()
+
+        if self.extract_cache is not None and suffix not in self.ARROW_SUFFIXES:
+            try:
+                path, suffix = self.extract_cache.arrow_path(path, self.dtypes), ".arrow"
+            except ImportError:
+                logger.warning("pyarrow is not available; reading the extract without the cache")
+            except (OSError, ValueError) as e:
+                logger.warning(f"Extract cache unavailable, reading {path} directly: {str(e)}")
+
+        if suffix in self.PARQUET_SUFFIXES or suffix in self.ARROW_SUFFIXES:
+            df = self._load_columnar(path, suffix, wanted, writable)
+        else:
+            df = self._load_csv(path, wanted)
+
+        logger.info(f"Loaded {len(df)} rows x {len(df.columns)} columns from {path}")
+        return self.encode_dimensions(self.apply_schema(df))
+
+    def _load_csv(self, path, wanted):
+        date_columns = [column for column, dtype in self.dtypes.items() if str(dtype).startswith("datetime")]
+        dtypes = {column: dtype for column, dtype in self.dtypes.items() if column not in date_columns}
+        if wanted is not None:
+            wanted_set = set(wanted)
+            usecols = lambda column: column in wanted_set
+            date_columns = [column for column in date_columns if column in wanted_set]
+        else:
+            usecols = None
+        return pd.read_csv(path, usecols=usecols, dtype=dtypes or None, parse_dates=date_columns or False,
+                           engine=self.schema.get("csv_engine", "c"))
+
+    def _load_columnar(self, path, suffix, wanted, writable=False):
+        try:
+            import pyarrow.feather as feather
+            import pyarrow.parquet as parquet
+        except ImportError as e:
+            raise ImportError("pyarrow is required to read Parquet or Arrow input") from e
+
+        if suffix in self.PARQUET_SUFFIXES:
+            available = parquet.read_schema(path).names
+            columns = None if wanted is None else [column for column in available if column in set(wanted)]
+            table = parquet.read_table(path, columns=columns, memory_map=True)
+        else:
+            table = feather.read_table(path, memory_map=True)
+            if wanted is not None:
+                table = table.select([column for column in table.column_names if column in set(wanted)])
+        # One block per column lets numeric columns stay (read-only) views onto the mapped file
+        df = table.to_pandas(split_blocks=True)
+        if writable:
+            for column in df.columns:
+                values = df[column].to_numpy() if isinstance(df[column].dtype, np.dtype) else None
+                if values is not None and not values.flags.writeable:
+                    df[column] = values.copy()
+        return df
+
+    def encode_dimensions(self, df):
+        """Convert dimension columns to categoricals (see the class docstring)."""
+        explicit = set(self.schema.get("categorical_columns") or [])
+        ratio = self.schema.get("auto_categorical_ratio", 0.05)
+        for column in df.columns:
+            series = df[column]
+            if isinstance(series.dtype, pd.CategoricalDtype):
+                continue
+            if column not in explicit:
+                is_text = pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series)
+                if not ratio or not is_text or not len(series) or series.nunique() > ratio * len(series):
+                    continue
+            df[column] = series.astype("category")
+        return df
+
+    def apply_schema(self, df):
+        """Cast columns to their schema dtypes where they differ."""
+        for column, dtype in self.dtypes.items():
+            if column not in df.columns or str(df[column].dtype) == str(dtype):
+                continue
+            if str(dtype).startswith("datetime"):
+                df[column] = pd.to_datetime(df[column], errors="coerce")
+            else:
+                df[column] = df[column].astype(dtype)
+        return df
+
+class ExtractCache:
+    """
+    On-disk Arrow IPC copies of input extracts, memory-mapped by every report process.
+
+    The first run converts an extract (CSV or Parquet) into an uncompressed Arrow IPC file
+    named after a fingerprint of the source, with a JSON manifest next to it. Later runs
+    map that file instead of parsing the source, so concurrent reports share one page-cache
+    copy of the data (the loaded frames are read-only views; see ReportDataLoader). The fingerprint hashes the size, modification time and first and last
+    MiB of the file (or the whole file when full_hash is set) and the schema column types.
+
+    CSV columns are typed as read_csv would type them: schema text columns stay strings
+    (keeping leading zeros), schema datetime columns become timestamps, and dates that
+    Arrow would infer in other columns are kept as text. The default directory is private
+    to the current user.
+    """
+    VERSION = 2
+    SAMPLE_BYTES = 1024 * 1024
+
+    def __init__(self, cache_dir, full_hash=False, max_extracts=4, block_size=64 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.full_hash = full_hash
+        self.max_extracts = max_extracts
+        self.block_size = block_size
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @classmethod
+    def from_config(cls, common):
+        """
+        Build the cache from the 'common' config section, or return None when disabled.
+
+        Recognised keys:
+            extract_cache_dir (str): Cache directory; an empty value disables the cache
+                (default: extracts/ in a private per-user temp directory)
+            extract_cache_full_hash (bool): Hash whole files instead of size, mtime and samples
+            extract_cache_max_extracts (int): Converted extracts kept, newest first (default 4)
+        """
+        try:
+            cache_dir = common.get("extract_cache_dir")
+            if cache_dir is None:
+                cache_dir = os.path.join(_private_cache_dir("report_cache"), "extracts")
+            if not cache_dir:
+                return None
+            return cls(cache_dir,
+                       full_hash=common.get("extract_cache_full_hash", False),
+                       max_extracts=common.get("extract_cache_max_extracts", 4))
+        except OSError as e:
+            logger.warning(f"Extract cache disabled: {str(e)}")
+            return None
+
+    def fingerprint(self, path, dtypes=None):
+        stat = os.stat(path)
+        types = ",".join(f"{column}={dtype}" for column, dtype in sorted((dtypes or {}).items()))
+        digest = hashlib.sha256(f"{self.VERSION}:{stat.st_size}:{stat.st_mtime_ns}:{types}".encode("utf-8"))
+        with open(path, "rb") as source:
+            if self.full_hash:
+                for block in iter(lambda: source.read(self.SAMPLE_BYTES), b""):
+                    digest.update(block)
+            else:
+                digest.update(source.read(self.SAMPLE_BYTES))
+                if stat.st_size > self.SAMPLE_BYTES:
+                    source.seek(max(stat.st_size - self.SAMPLE_BYTES, self.SAMPLE_BYTES))
+                    digest.update(source.read())
+        return digest.hexdigest()
+
+    def arrow_path(self, path, dtypes=None):
+        """
+        Return the Arrow IPC file for path, converting the source on first use.
+
+        Args:
+            dtypes (dict): Schema dtypes by column, used to type CSV columns
+        """
+        key = self.fingerprint(path, dtypes)
+        arrow_path = os.path.join(self.cache_dir, f"{key}.arrow")
+        manifest_path = os.path.join(self.cache_dir, f"{key}.json")
+        if os.path.exists(manifest_path) and os.path.exists(arrow_path):
+            return arrow_path
+
+        start = time.time()
+        rows, columns = self._convert(path, arrow_path, dtypes)
+        manifest = {
+            "version": self.VERSION,
+            "source": os.path.abspath(path),
+            "rows": rows,
+            "columns": columns,
+            "created": datetime.now().isoformat(),
+        }
+        with tempfile.NamedTemporaryFile("w", dir=self.cache_dir, suffix=".tmp", delete=False) as temp_file:
+            json.dump(manifest, temp_file)
+        os.replace(temp_file.name, manifest_path)
+        logger.info(f"Cached {path} as {arrow_path} ({rows} rows) in {time.time() - start:.1f}s")
+        self._evict()
+        return arrow_path
+
+    def _evict(self):
+        """Drop the oldest converted extracts beyond max_extracts; mapped files stay readable until closed."""
+        manifests = sorted((entry.stat().st_mtime, entry.path) for entry in os.scandir(self.cache_dir)
+                           if entry.name.endswith(".json"))
+        for _, manifest_path in manifests[:max(len(manifests) - self.max_extracts, 0)]:
+            for stale_path in (manifest_path, manifest_path[:-len(".json")] + ".arrow"):
+                try:
+                    os.remove(stale_path)
+                except OSError:
+                    pass
+
+    @staticmethod
+    def _csv_column_types(dtypes, inferred):
+        """Arrow types for CSV columns whose inferred type wouldn't match read_csv plus the schema."""
+        import pyarrow as pa
+
+        column_types = {}
+        for field in inferred:
+            dtype = (dtypes or {}).get(field.name)
+            if dtype is None:
+                # read_csv leaves unparsed dates as text
+                if pa.types.is_temporal(field.type):
+                    column_types[field.name] = pa.string()
+                continue
+            try:
+                dtype = pd.api.types.pandas_dtype(dtype)
+            except TypeError:
+                column_types[field.name] = pa.string()
+                continue
+            if pd.api.types.is_datetime64_any_dtype(dtype):
+                column_types[field.name] = pa.timestamp("ns")
+            elif not (pd.api.types.is_numeric_dtype(dtype) or pd.api.types.is_bool_dtype(dtype)):
+                column_types[field.name] = pa.string()
+        return column_types
+
+    def _convert(self, path, arrow_path, dtypes=None):
+        """Write the source to arrow_path batch by batch; returns (rows, column names)."""
+        import pyarrow as pa
+        import pyarrow.csv as pa_csv
+        import pyarrow.parquet as parquet
+
+        read_options = pa_csv.ReadOptions(block_size=self.block_size)
+        if os.path.splitext(path)[1].lower() in ReportDataLoader.PARQUET_SUFFIXES:
+            parquet_file = parquet.ParquetFile(path)
+            schema, batches = parquet_file.schema_arrow, parquet_file.iter_batches()
+        else:
+            try:
+                inferred = pa_csv.open_csv(path, read_options=read_options).schema
+                convert_options = pa_csv.ConvertOptions(column_types=self._csv_column_types(dtypes, inferred))
+                reader = pa_csv.open_csv(path, read_options=read_options, convert_options=convert_options)
+                schema, batches = reader.schema, reader
+            except pa.ArrowInvalid:
+                table = self._read_csv_table(path, dtypes)
+                schema, batches = table.schema, table.to_batches()
+
+        rows = 0
+        with tempfile.NamedTemporaryFile(dir=self.cache_dir, suffix=".tmp", delete=False) as temp_file:
+            temp_name = temp_file.name
+        try:
+            try:
+                with pa.OSFile(temp_name, "wb") as sink, pa.ipc.new_file(sink, schema) as writer:
+                    for batch in batches:
+                        writer.write_batch(batch)
+                        rows += batch.num_rows
+            except pa.ArrowInvalid:
+                # Types inferred from the first CSV block didn't hold for later ones
+                table = self._read_csv_table(path, dtypes)
+                schema, rows = table.schema, table.num_rows
+                with pa.OSFile(temp_name, "wb") as sink, pa.ipc.new_file(sink, schema) as writer:
+                    writer.write_table(table)
+            os.replace(temp_name, arrow_path)
+        except BaseException:
+            os.remove(temp_name)
+            raise
+        return rows, schema.names
+
+    def _read_csv_table(self, path, dtypes):
+        """Read a whole CSV, inferring types from all of it, then typed like open_csv above."""
+        import pyarrow.csv as pa_csv
+
+        inferred = pa_csv.read_csv(path).schema
+        convert_options = pa_csv.ConvertOptions(column_types=self._csv_column_types(dtypes, inferred))
+        return pa_csv.read_csv(path, convert_options=convert_options)
+
+class FilterCriteriaStore:
+    """
+    Section filters from BOOK_CONF_FILTER_CRITERIA, loaded a whole report at a time.
+
+    One query fetches the criteria for every section of a report; rows are
+    grouped by TABLE_NAME into compiled {column: FilterExpression} dicts and kept for
+    ttl seconds, so a report with many sections makes one round trip.
+    """
+    QUERY = """
+        SELECT TABLE_NAME, COLUMN_NAME, OPERATOR, CONDITION, IS_LIST
+        FROM mera_db.BOOK_CONF_FILTER_CRITERIA
+        WHERE REPORT_NAME = '{report_name}'
+        """
+
+    def __init__(self, db_cursor, ttl=300):
+        self.db_cursor = db_cursor
+        self.ttl = ttl
+        self._reports = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, db_cursor, common):
+        """
+        Build the store from the 'common' config section.
+
+        Recognised keys:
+            filter_criteria_ttl (int): Seconds loaded criteria stay valid (default 300)
+        """
+        return cls(db_cursor, ttl=common.get("filter_criteria_ttl", 300))
+
+    def load(self, report_name):
+        """
+        Return {table_name: {column: FilterExpression}} for every section of report_name.
+        """
+        with self._lock:
+            entry = self._reports.get(report_name)
+            if entry is not None and time.monotonic() - entry[0] < self.ttl:
+                return entry[1]
+
+        if not self.db_cursor:
+            logger.warning("No database cursor available. Skipping filter criteria load.")
+            return {}
+
+        # get_df takes only a query string, so the report name is inlined as a quoted literal
+        quoted_name = str(report_name).replace("'", "''")
+        rows = self.db_cursor.get_df(self.QUERY.format(report_name=quoted_name))
+        criteria = self.compile_rows(rows.to_dict("records") if hasattr(rows, "to_dict") else rows)
+        logger.info(f"Loaded filter criteria for {len(criteria)} sections of {report_name}")
+
+        with self._lock:
+            self._reports[report_name] = (time.monotonic(), criteria)
+        return criteria
+
+    def get(self, report_name, section_name):
+        """Compiled filter criteria for one section; empty when the section has none."""
+        return self.load(report_name).get(section_name, {})
+
+    def invalidate(self, report_name=None):
+        """Drop cached criteria for one report, or for all reports."""
+        with self._lock:
+            if report_name is None:
+                self._reports.clear()
+            else:
+                self._reports.pop(report_name, None)
+
+    @staticmethod
+    def compile_rows(rows):
+        """Group criteria rows by TABLE_NAME and AND the rows that share a column."""
+        grouped = {}
+        for row in rows:
+            column, expression = FilterExpression.from_criteria_row(row)
+            grouped.setdefault(str(row["TABLE_NAME"]).strip(), {}).setdefault(column, []).append(expression)
+        return {
+            table_name: {column: FilterExpression.all_of(expressions) for column, expressions in columns.items()}
+            for table_name, columns in grouped.items()
+        }
+
+def _private_cache_dir(name):
+    """
+    Per-user cache directory under the system temp dir, created with mode 0700.
+
+    Raises OSError if the directory exists but is not a real directory owned by this
+    user and closed to everyone else, so other local users can't plant files in it.
+    """
+    owner = os.getuid() if hasattr(os, "getuid") else os.environ.get("USERNAME", "user")
+    path = os.path.join(tempfile.gettempdir(), f"{name}-{owner}")
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    info = os.lstat(path)
+    if hasattr(os, "getuid"):
+        if not os.path.isdir(path) or os.path.islink(path) or info.st_uid != os.getuid():
+            raise OSError(f"Cache directory {path} is not owned by the current user")
+        if info.st_mode & 0o077:
+            raise OSError(f"Cache directory {path} is accessible to other users")
+    return path
+
+class MappingSnapshot:
+    """
+    Local snapshot of the ENTITY_MAPPING dict, reused across report runs.
+
+    The file is JSON holding the format version, the mapping dict, the probe taken when
+    it was saved and the save time; by default it lives in a private per-user directory.
+    A snapshot is used while it is younger than ttl and its probe (row count, plus the max
+    of probe_column when configured) still matches the table, so most starts skip the
+    full mapping query. Corrupt or stale files are ignored and rewritten.
+    """
+    VERSION = 2
+    TABLE = "mera_db.BOOK.ENTITY_MAPPING"
+
+    def __init__(self, path, ttl=7 * 24 * 3600, probe_column=None):
+        self.path = path
+        self.ttl = ttl
+        self.probe_column = probe_column
+
+    @classmethod
+    def from_config(cls, common):
+        """
+        Build the snapshot from the 'common' config section, or return None when disabled.
+
+        Recognised keys:
+            mapping_snapshot_path (str): Snapshot file; an empty value disables the snapshot
+                (default: report_entity_mapping.json in a private per-user temp directory)
+            mapping_snapshot_ttl (int): Maximum snapshot age in seconds (default one week)
+            mapping_snapshot_probe_column (str): Timestamp column whose max is part of the probe
+        """
+        path = common.get("mapping_snapshot_path")
+        if path is None:
+            try:
+                path = os.path.join(_private_cache_dir("report_cache"), "report_entity_mapping.json")
+            except OSError as e:
+                logger.warning(f"Mapping snapshot disabled: {str(e)}")
+                return None
+        if not path:
+            return None
+        return cls(path,
+                   ttl=common.get("mapping_snapshot_ttl", 7 * 24 * 3600),
+                   probe_column=common.get("mapping_snapshot_probe_column"))
+
+    def probe(self, db_cursor):
+        """Return a cheap fingerprint of the mapping table, or None if it can't be taken."""
+        columns = "COUNT(*) AS ROW_COUNT"
+        if self.probe_column:
+            columns += f", MAX({self.probe_column}) AS MAX_VALUE"
+        try:
+            result = db_cursor.get_df(f"SELECT {columns} FROM {self.TABLE}")
+            return tuple(str(value) for value in result.iloc[0].tolist())
+        except Exception as e:
+            logger.warning(f"Error probing {self.TABLE}: {str(e)}")
+            return None
+
+    def load(self, probe):
+        """
+        Return the snapshot's mapping dict if it is intact, fresh and matches probe.
+
+        A None probe (the probe query failed) accepts any snapshot within ttl.
+        """
+        try:
+            with open(self.path, "r", encoding="utf-8") as snapshot_file:
+                snapshot = json.load(snapshot_file)
+        except OSError:
+            return None
+        except ValueError as e:
+            logger.warning(f"Mapping snapshot {self.path} is unreadable, reloading: {str(e)}")
+            return None
+
+        try:
+            if snapshot["version"] != self.VERSION or not isinstance(snapshot["mapping_dict"], dict):
+                return None
+            if time.time() - float(snapshot["saved_at"]) > self.ttl:
+                return None
+            saved_probe = snapshot["probe"]
+            if probe is not None and (saved_probe is None or tuple(saved_probe) != tuple(probe)):
+                logger.info(f"{self.TABLE} changed since the mapping snapshot, reloading")
+                return None
+        except (KeyError, TypeError, ValueError):
+            logger.warning(f"Mapping snapshot {self.path} is malformed, reloading")
+            return None
+        return snapshot["mapping_dict"]
+
+    def save(self, mapping_dict, probe):
+        """Write the snapshot atomically; failures only cost the next run a full load."""
+        snapshot = {"version": self.VERSION, "mapping_dict": mapping_dict,
+                    "probe": None if probe is None else list(probe), "saved_at": time.time()}
+        directory = os.path.dirname(os.path.abspath(self.path))
+        try:
+            os.makedirs(directory, exist_ok=True)
+            with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=directory, suffix=".tmp",
+                                             delete=False) as temp_file:
+                json.dump(snapshot, temp_file)
+            os.replace(temp_file.name, self.path)
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"Error writing mapping snapshot: {str(e)}")
+
+class MultiPatternReplacer:
+    """
+    Aho-Corasick automaton that replaces many substrings in one scan of the text.
+
+    Overlapping matches resolve leftmost first, then longest; replaced text isn't rescanned.
+    """
+    def __init__(self, replacements):
+        self.replacements = {pattern: replacement for pattern, replacement in replacements.items()
+                             if isinstance(pattern, str) and pattern}
+        self._goto = [{}]
+        self._fail = [0]
+        self._outputs = [()]
+
+        for pattern in self.replacements:
+            node = 0
+            for char in pattern:
+                next_node = self._goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self._goto)
+                    self._goto[node][char] = next_node
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._outputs.append(())
+                node = next_node
+            self._outputs[node] = (len(pattern),)
+
+        # Breadth-first failure links; each node also reports the patterns its suffixes end
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[child] = target if target != child else 0
+                self._outputs[child] = self._outputs[child] + self._outputs[self._fail[child]]
+
+    def find(self, text):
+        """Return non-overlapping (start, end) spans of pattern matches in text."""
+        goto, fail, outputs = self._goto, self._fail, self._outputs
+        matches = []
+        node = 0
+        for position, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for length in outputs[node]:
+                matches.append((position + 1 - length, position + 1))
+
+        if len(matches) > 1:
+            matches.sort(key=lambda span: (span[0], span[0] - span[1]))
+        spans = []
+        last_end = 0
+        for start, end in matches:
+            if start >= last_end:
+                spans.append((start, end))
+                last_end = end
+        return spans
+
+    def replace(self, text):
+        spans = self.find(text)
+        if not spans:
+            return text
+        parts = []
+        last_end = 0
+        for start, end in spans:
+            parts.append(text[last_end:start])
+            parts.append(self.replacements[text[start:end]])
+            last_end = end
+        parts.append(text[last_end:])
+        return "".join(parts)
+
+class MappingIndex:
+    """
+    ENTITY_MAPPING (FULL_NAME -> SHORT_NAME by TYPE) indexed for apply_mapping and map_column.
+
+    FUND_NAME values have every full name replaced in one Aho-Corasick pass, then each word
+    mapped on its own. Other types are one dict lookup over all types, the first type
+    listing a name winning as before. Results are memoized per distinct value.
+    """
+    FUND_NAME = "FUND_NAME"
+
+    def __init__(self, mapping_dict):
+        self.mapping_dict = mapping_dict
+        self._any_type = {}
+        for type_dict in mapping_dict.values():
+            for full_name, short_name in type_dict.items():
+                self._any_type.setdefault(full_name, short_name)
+        self._replacers = {}
+        self._memo = {}
+
+    def _replacer(self, mapping_type):
+        replacer = self._replacers.get(mapping_type)
+        if replacer is None:
+            replacer = MultiPatternReplacer(self.mapping_dict.get(mapping_type, {}))
+            self._replacers[mapping_type] = replacer
+        return replacer
+
+    def map_value(self, value, mapping_type):
+        """Map one value; non-FUND_NAME values without a mapping give None."""
+        if mapping_type != self.FUND_NAME:
+            return self._any_type.get(value)
+
+        memo = self._memo.setdefault(mapping_type, {})
+        mapped = memo.get(value)
+        if mapped is None:
+            type_dict = self.mapping_dict.get(mapping_type, {})
+            replaced = self._replacer(mapping_type).replace(value)
+            mapped = " ".join(type_dict.get(word, word) for word in replaced.split())
+            memo[value] = mapped
+        return mapped
+
+    def map_column(self, series, mapping_type):
+        """Map a whole Series, working on each distinct value once."""
+        if mapping_type != self.FUND_NAME:
+            return series.map(self._any_type)
+        codes, uniques = pd.factorize(series, use_na_sentinel=True)
+        mapped = np.array([self.map_value(value, mapping_type) for value in uniques] + [np.nan], dtype=object)
+        return pd.Series(mapped[codes], index=series.index, name=series.name)
+
+class FilterMaskCache:
+    """
+    Boolean row masks for section filter criteria over one DataFrame.
+
+    Each (column, condition) pair is evaluated once and its mask cached; the AND of a
+    section's masks is cached per prefix of its sorted terms, so sections that share
+    leading filters (the same team list, say) reuse the combined mask as well.
+    Conditions are compiled with FilterExpression, so YAML criteria and rows from
+    BOOK_CONF_FILTER_CRITERIA share one grammar. With use_index, IN, equality and
+    numeric range lookups come from a ColumnIndex instead of full column scans.
+    """
+    def __init__(self, df, use_index=True):
+        self.df = df
+        self.index = ColumnIndex(df) if use_index else None
+        self._term_masks = {}
+        self._combined_masks = {}
+
+    @staticmethod
+    def canonical_term(column, condition):
+        """Return a hashable (column, FilterExpression) term, or None if the condition doesn't filter."""
+        expression = FilterExpression.compile(condition)
+        if expression is None:
+            return None
+        return (column, expression)
+
+    def term_mask(self, term):
+        """Boolean numpy mask for one canonical term."""
+        mask = self._term_masks.get(term)
+        if mask is None:
+            column, expression = term
+            mask = expression.mask(self.df, column, self.index)
+            self._term_masks[term] = mask
+        return mask
+
+    def terms(self, filter_criteria):
+        """Sorted, de-duplicated canonical terms of a filter_criteria dict; identifies its mask."""
+        terms = set()
+        for column, condition in (filter_criteria or {}).items():
+            term = self.canonical_term(column, condition)
+            if term is not None:
+                terms.add(term)
+        return tuple(sorted(terms, key=repr))
+
+    def mask(self, filter_criteria):
+        """
+        Combined mask for a filter_criteria dict.
+
+        Returns:
+            numpy.ndarray or None: None when no criterion filters anything
+        """
+        terms = self.terms(filter_criteria)
+        if not terms:
+            return None
+
+        mask = None
+        for end in range(1, len(terms) + 1):
+            prefix = terms[:end]
+            combined = self._combined_masks.get(prefix)
+            if combined is None:
+                term = self.term_mask(prefix[-1])
+                combined = term if mask is None else mask & term
+                self._combined_masks[prefix] = combined
+            mask = combined
+        return mask
+
+    def filter(self, filter_criteria):
+        """Rows of the DataFrame matching filter_criteria; the DataFrame itself when nothing filters."""
+        mask = self.mask(filter_criteria)
+        if mask is None:
+            return self.df
+        return self.df[mask]
+
+class FramePartitions:
+    """
+    Rows of a DataFrame grouped by one or more partition keys in a single pass.
+
+    The frame is stably sorted by the key codes once (it is used as-is when already in
+    key order), so every group, and every group of a leading subset of the keys, is a
+    contiguous positional slice. Picking a partition on all of the keys is an iloc slice
+    rather than a boolean scan over the whole frame; partial keys take just that
+    partition's rows. Either way rows come back in their original order.
+    """
+    def __init__(self, df, keys):
+        self.df = df
+        self.keys = tuple(keys)
+        codes = []
+        uniques = []
+        for key in self.keys:
+            column = df[key]
+            if isinstance(column.dtype, pd.CategoricalDtype):
+                key_codes, key_uniques = column.cat.codes.to_numpy(), column.cat.categories
+            else:
+                key_codes, key_uniques = pd.factorize(column, use_na_sentinel=True)
+            # Nulls sort after every value, as they do in sort_values
+            key_codes = np.where(key_codes < 0, len(key_uniques), key_codes).astype(np.int64)
+            codes.append(key_codes)
+            uniques.append(key_uniques)
+        self._uniques = uniques
+
+        if len(codes) == 1:
+            order = np.argsort(codes[0], kind="stable")
+        else:
+            order = np.lexsort(codes[::-1])
+        self._order = order
+        if len(order) and (order[1:] > order[:-1]).all():
+            self.frame = df
+            sorted_codes = codes
+        else:
+            self.frame = df.take(order)
+            sorted_codes = [key_codes[order] for key_codes in codes]
+
+        # (start, stop) of each group, for every number of leading keys
+        self._ranges = [{}]
+        changed = np.zeros(max(len(df) - 1, 0), dtype=bool)
+        for depth, key_codes in enumerate(sorted_codes, start=1):
+            changed |= key_codes[1:] != key_codes[:-1]
+            starts = np.concatenate(([0], np.flatnonzero(changed) + 1)) if len(df) else np.empty(0, dtype=np.int64)
+            stops = np.append(starts[1:], len(df))
+            ranges = {}
+            for start, stop in zip(starts.tolist(), stops.tolist()):
+                group = tuple(self._value(level, sorted_codes[level][start]) for level in range(depth))
+                ranges[group] = (start, stop)
+            self._ranges.append(ranges)
+
+    def _value(self, level, code):
+        uniques = self._uniques[level]
+        return None if code >= len(uniques) else uniques[code]
+
+    def get(self, *values):
+        """Rows whose leading partition keys equal values, as a positional slice of the partitioned frame."""
+        if not values:
+            return self.frame
+        bounds = self._ranges[len(values)].get(tuple(values))
+        if bounds is None:
+            return self.frame.iloc[0:0]
+        start, stop = bounds
+        if len(values) < len(self.keys) and self.frame is not self.df:
+            # Sub-partitions are interleaved in key order; restore the original row order
+            return self.df.iloc[np.sort(self._order[start:stop])]
+        return self.frame.iloc[start:stop]
+
+    def select(self, values):
+        """
+        Rows matching a {key: value} dict over any of the partition keys.
+
+        A leading run of keys is looked up with get; otherwise the matching groups at
+        the deepest requested key are gathered.
+        """
+        unknown = [key for key in values if key not in self.keys]
+        if unknown:
+            raise KeyError(f"Not a partition key: {', '.join(map(str, unknown))} (partition_by: {list(self.keys)})")
+        depth = 0
+        while depth < len(self.keys) and self.keys[depth] in values:
+            depth += 1
+        if depth == len(values):
+            return self.get(*(values[key] for key in self.keys[:depth]))
+
+        wanted = {self.keys.index(key): value for key, value in values.items()}
+        groups = [bounds for group, bounds in self._ranges[max(wanted) + 1].items()
+                  if all(group[level] == value for level, value in wanted.items())]
+        if not groups:
+            return self.frame.iloc[0:0]
+        positions = np.concatenate([self._order[start:stop] for start, stop in groups])
+        return self.df.iloc[np.sort(positions)]
+
+class GroupedAggregator:
+    """
+    Totals and grouped subtotals of configured measures for filtered views of one frame.
+
+    Grouping columns are factorized once per frame (sorted, nulls dropped as in groupby).
+    Each filtered view then takes its mask from the FilterMaskCache and aggregates every
+    measure at every level with one bincount (sum, count, mean) or one sorted reduceat
+    (min, max). Results are cached per (filter, measures, levels).
+
+    Measures are dicts with column, func (sum, count, min, max or mean; default sum) and
+    optional name, precision and format. A missing measure column counts as all null, and
+    a level naming a missing column is skipped.
+    """
+    FUNCTIONS = ("sum", "count", "min", "max", "mean")
+
+    # Table totals when neither the table nor the report configures an aggregation
+    DEFAULT_MEASURES = [{"column": "MARKET_VALUE", "func": "sum"}]
+    DEFAULT_LEVELS = [["INVESTMENT_TEAM_NAME", "INVESTMENT_SUB_TEAM_NAME"]]
+
+    def __init__(self, mask_cache):
+        self.mask_cache = mask_cache
+        self.df = mask_cache.df
+        self._level_codes = {}
+        self._measure_values = {}
+        self._results = {}
+
+    @classmethod
+    def normalize_measures(cls, measures):
+        """Fill in defaults and validate measure dicts."""
+        normalized = []
+        for measure in measures:
+            func = measure.get("func", "sum")
+            if func not in cls.FUNCTIONS:
+                raise ValueError(f"Unsupported aggregation function: {func}")
+            normalized.append(dict(measure, func=func, name=measure.get("name", f"{func}_{measure['column']}")))
+        return normalized
+
+    def _codes(self, columns):
+        """Combined group code per row (-1 where any key is null) and the per-column uniques."""
+        entry = self._level_codes.get(columns)
+        if entry is None:
+            combined = np.zeros(len(self.df), dtype=np.int64)
+            valid = np.ones(len(self.df), dtype=bool)
+            uniques = []
+            for column in columns:
+                codes, column_uniques = pd.factorize(self.df[column], sort=True, use_na_sentinel=True)
+                valid &= codes >= 0
+                combined = combined * max(len(column_uniques), 1) + codes
+                uniques.append(column_uniques)
+            combined[~valid] = -1
+            entry = (combined, uniques)
+            self._level_codes[columns] = entry
+        return entry
+
+    def _values(self, column, func):
+        key = (column, func == "count")
+        values = self._measure_values.get(key)
+        if values is None:
+            if column not in self.df.columns:
+                values = np.full(len(self.df), np.nan)
+            elif func == "count":
+                values = self.df[column].notna().to_numpy(dtype=float)
+            else:
+                values = pd.to_numeric(self.df[column], errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+            self._measure_values[key] = values
+        return values
+
+    def aggregate(self, filter_criteria, measures, levels=()):
+        """
+        Aggregate the rows matching filter_criteria.
+
+        Args:
+            measures (list): Measure dicts (see class docstring)
+            levels (list): Lists of grouping columns, e.g. [["TEAM"], ["TEAM", "SUB_TEAM"]]
+
+        Returns:
+            dict: {"total": {name: value},
+                   "levels": {tuple(columns): {"keys": [array per column], "measures": {name: array}}}}
+            Group keys are sorted the way DataFrame.groupby sorts them.
+        """
+        measures = self.normalize_measures(measures)
+        levels = tuple(tuple(level) for level in levels)
+        cache_key = (self.mask_cache.terms(filter_criteria), repr(measures), levels)
+        result = self._results.get(cache_key)
+        if result is not None:
+            return result
+
+        mask = self.mask_cache.mask(filter_criteria)
+        rows = np.arange(len(self.df)) if mask is None else np.flatnonzero(mask)
+
+        totals = {}
+        for measure in measures:
+            values = self._values(measure["column"], measure["func"])[rows]
+            totals[measure["name"]] = self._reduce_all(values, measure["func"])
+
+        level_results = {}
+        for level in levels:
+            if any(column not in self.df.columns for column in level):
+                continue
+            combined, uniques = self._codes(level)
+            codes = combined[rows]
+            keep = codes >= 0
+            group_codes, inverse = np.unique(codes[keep], return_inverse=True)
+            level_rows = rows[keep]
+
+            keys = []
+            remainder = group_codes
+            for column_uniques in reversed(uniques):
+                size = max(len(column_uniques), 1)
+                remainder, column_codes = np.divmod(remainder, size)
+                keys.append(np.asarray(column_uniques, dtype=object)[column_codes])
+            keys.reverse()
+
+            order = np.argsort(inverse, kind="stable")
+            starts = np.searchsorted(inverse[order], np.arange(len(group_codes)))
+            level_measures = {}
+            for measure in measures:
+                values = self._values(measure["column"], measure["func"])[level_rows]
+                level_measures[measure["name"]] = self._reduce_groups(values, measure["func"], inverse,
+                                                                      order, starts, len(group_codes))
+            level_results[level] = {"keys": keys, "measures": level_measures}
+
+        result = {"total": totals, "levels": level_results}
+        self._results[cache_key] = result
+        return result
+
+    def subtotals(self, filter_criteria, group_by, measures):
+        """
+        Sorted row order and nested subtotals for inline subtotal rows.
+
+        Rows matching filter_criteria are ordered by group_by in one stable sort (rows with a
+        null key go last and get no subtotal); each prefix of group_by is a level.
+
+        Returns:
+            dict: {"positions": row positions in display order,
+                   "levels": [{"columns": tuple, "ends": array, "keys": [array per column],
+                               "measures": {name: array}}, ...] outermost first}
+            ends[i] is the index into positions of the last row of the level's i-th group.
+        """
+        measures = self.normalize_measures(measures)
+        group_by = tuple(group_by)
+        cache_key = ("subtotals", self.mask_cache.terms(filter_criteria), repr(measures), group_by)
+        result = self._results.get(cache_key)
+        if result is not None:
+            return result
+
+        mask = self.mask_cache.mask(filter_criteria)
+        rows = np.arange(len(self.df)) if mask is None else np.flatnonzero(mask)
+        combined, _ = self._codes(group_by)
+        codes = combined[rows]
+        sort_key = np.where(codes >= 0, codes, np.iinfo(np.int64).max)
+        positions = rows[np.argsort(sort_key, kind="stable")]
+        grouped = positions[:int((codes >= 0).sum())]
+
+        levels = []
+        for depth in range(1, len(group_by) + 1):
+            columns = group_by[:depth]
+            level_codes = self._codes(columns)[0][grouped]
+            changes = np.flatnonzero(level_codes[1:] != level_codes[:-1])
+            starts = np.concatenate(([0], changes + 1)) if len(grouped) else np.empty(0, dtype=np.intp)
+            ends = np.append(changes, len(grouped) - 1) if len(grouped) else np.empty(0, dtype=np.intp)
+            inverse = np.cumsum(np.concatenate(([0], (level_codes[1:] != level_codes[:-1]).astype(np.intp))))
+            order = np.arange(len(grouped))
+
+            keys = [self.df[column].to_numpy(dtype=object)[grouped[starts]] for column in columns]
+            level_measures = {}
+            for measure in measures:
+                values = self._values(measure["column"], measure["func"])[grouped]
+                level_measures[measure["name"]] = self._reduce_groups(values, measure["func"], inverse,
+                                                                      order, starts, len(starts))
+            levels.append({"columns": columns, "ends": ends, "keys": keys, "measures": level_measures})
+
+        result = {"positions": positions, "levels": levels}
+        self._results[cache_key] = result
+        return result
+
+    @staticmethod
+    def _reduce_all(values, func):
+        present = values[~np.isnan(values)]
+        if func in ("sum", "count"):
+            return float(present.sum())
+        if not len(present):
+            return np.nan
+        if func == "mean":
+            return float(present.mean())
+        return float(present.min() if func == "min" else present.max())
+
+    @staticmethod
+    def _reduce_groups(values, func, inverse, order, starts, group_count):
+        if not group_count:
+            return np.empty(0)
+        present = ~np.isnan(values)
+        if func in ("sum", "count", "mean"):
+            sums = np.bincount(inverse, weights=np.where(present, values, 0.0), minlength=group_count)
+            if func != "mean":
+                return sums
+            counts = np.bincount(inverse, weights=present, minlength=group_count)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                return np.where(counts > 0, sums / counts, np.nan)
+        reducer = np.fmin if func == "min" else np.fmax
+        return reducer.reduceat(values[order], starts)
+
+class FlagSink:
+    """
+    Collects flagged records over a whole report run and writes them in large batches.
+
+    Records are buffered per table and written batch_size at a time: with COPY when the
+    cursor offers copy_expert (psycopg2 style), otherwise with executemany in chunks of
+    executemany_chunk rows. The run is committed once, by close(). With background=True
+    batches are written on a worker thread so rendering never waits on the database;
+    the cursor must then not be used by anything else until close() returns.
+    """
+    COLUMNS = ("index", "column_name", "severity", "color", "text_color")
+    FIELDS = ("index", "column", "severity", "color", "text_color")
+
+    def __init__(self, db_cursor, batch_size=10000, executemany_chunk=1000, background=False):
+        self.db_cursor = db_cursor
+        self.batch_size = batch_size
+        self.executemany_chunk = executemany_chunk
+        self.background = background
+        self.written = 0
+        self._buffers = {}
+        self._queue = None
+        self._worker = None
+        self._error = None
+
+    @classmethod
+    def from_config(cls, db_cursor, common):
+        """
+        Build a sink from the 'common' config section, or return None without a cursor.
+
+        Recognised keys:
+            flag_sink_batch_size (int): Records per write (default 10000)
+            flag_sink_executemany_chunk (int): Rows per executemany call (default 1000)
+            flag_sink_background (bool): Write on a worker thread (default false)
+        """
+        if not db_cursor:
+            return None
+        return cls(db_cursor,
+                   batch_size=common.get("flag_sink_batch_size", 10000),
+                   executemany_chunk=common.get("flag_sink_executemany_chunk", 1000),
+                   background=common.get("flag_sink_background", False))
+
+    def add(self, flagged_data, table_name):
+        """Buffer flagged records for table_name, writing full batches as they fill up."""
+        if not isinstance(flagged_data, list):
+            raise ValueError("flagged_data must be a list")
+        if not table_name or not isinstance(table_name, str):
+            raise ValueError("Invalid table_name")
+        try:
+            rows = [tuple(item[field] for field in self.FIELDS) for item in flagged_data]
+        except KeyError as e:
+            raise ValueError(f"Missing required field {e} in flagged item") from None
+
+        buffer = self._buffers.setdefault(table_name, [])
+        buffer.extend(rows)
+        while len(buffer) >= self.batch_size:
+            batch = buffer[:self.batch_size]
+            del buffer[:self.batch_size]
+            self._submit(table_name, batch)
+
+    def _submit(self, table_name, rows):
+        if not self.background:
+            self._write(table_name, rows)
+            return
+        if self._worker is None:
+            self._queue = queue.Queue()
+            self._worker = threading.Thread(target=self._run, name="flag-sink", daemon=True)
+            self._worker.start()
+        self._queue.put((table_name, rows))
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            if self._error is not None:
+                continue
+            try:
+                self._write(*item)
+            except Exception as e:
+                self._error = e
+
+    def _write(self, table_name, rows):
+        columns = ", ".join(self.COLUMNS)
+        if hasattr(self.db_cursor, "copy_expert"):
+            data = io.StringIO()
+            csv.writer(data).writerows(rows)
+            data.seek(0)
+            self.db_cursor.copy_expert(f"COPY {table_name} ({columns}) FROM STDIN WITH (FORMAT csv)", data)
+        else:
+            placeholders = ", ".join(["%s"] * len(self.COLUMNS))
+            insert_query = f"INSERT INTO {table_name} ({columns}) VALUES ({placeholders})"
+            for start in range(0, len(rows), self.executemany_chunk):
+                self.db_cursor.executemany(insert_query, rows[start:start + self.executemany_chunk])
+        self.written += len(rows)
+
+    def close(self):
+        """Write what is left, wait for background writes and commit the run once."""
+        try:
+            for table_name, rows in self._buffers.items():
+                if rows:
+                    self._submit(table_name, rows)
+            self._buffers = {}
+
+            if self._worker is not None:
+                self._queue.put(None)
+                self._worker.join()
+                self._worker = None
+            if self._error is not None:
+                raise self._error
+
+            if self.written:
+                self.db_cursor.commit()
+                logger.info(f"Successfully saved {self.written} flagged items")
+
+        except Exception as e:
+            logger.error(f"Error saving flagged data: {str(e)}")
+            if hasattr(self.db_cursor, 'rollback'):
+                self.db_cursor.rollback()
+            raise
+        finally:
+            self.written = 0
+            self._error = None
+
+class FlagManager:
+    def __init__(self, flag_rules):
+        """Initialize FlagManager with validation of flag rules."""
+        try:
+            if not isinstance(flag_rules, dict):
+                raise ValueError("flag_rules must be a dictionary")
+            
+            # Store flag rules
+            self.flag_rules = flag_rules
+            self._compiled_rules = None
+            
+            # Set by the engine; with a sink, flagged records are batched over the whole run
+            self.db_cursor = None
+            self.flag_sink = None
+            
+            # For backward compatibility with the original format
+            for category, rules in flag_rules.items():
+                if isinstance(rules, list):
+                    for rule in rules:
+                        # Check if rule has required fields
+                        if 'conditions' not in rule:
+                            rule['conditions'] = []
+                            # Create a condition from field, operator, value if available
+                            if all(k in rule for k in ['field', 'operator', 'value']):
+                                rule['conditions'].append({
+                                    'field': rule['field'],
+                                    'operator': rule['operator'],
+                                    'value': rule['value']
+                                })
+                        
+                        # Set default values for missing fields
+                        if 'name' not in rule:
+                            rule['name'] = f"Rule for {category}"
+                        if 'flag_color' not in rule and 'color' not in rule:
+                            rule['flag_color'] = "#ffcccc"
+                        if 'text_color' not in rule:
+                            rule['text_color'] = "#000000"
+            
+            logger.info(f"FlagManager initialized with {len(flag_rules)} rule categories")
+            
+        except Exception as e:
+            logger.error(f"Error initializing FlagManager: {str(e)}")
+            raise
+
+    def evaluate_conditions(self, row, conditions):
+        """Evaluate conditions with proper error handling and validation."""
+        try:
+            if not conditions:
+                return False
+                
+            for condition in conditions:
+                field = condition.get("field")
+                operator = condition.get("operator")
+                value = condition.get("value")
+                
+                if not all([field, operator]):
+                    logger.warning(f"Missing required condition fields: {condition}")
+                    continue
+                
+                # Skip if field is not in the row
+                if field not in row:
+                    logger.warning(f"Field '{field}' not found in row")
+                    continue
+                
+                # Get field value from row
+                field_value = row[field]
+                
+                # Skip evaluation if field value is NaN or None
+                if pd.isna(field_value):
+                    continue
+                
+                # Evaluate the condition
+                result = self._evaluate_operator(field_value, operator, value)
+                
+                # If any condition is false, return false (AND logic)
+                if not result:
+                    return False
+            
+            # All conditions passed
+            return True
+            
+        except Exception as e:
+            logger.error(f"Error evaluating conditions: {str(e)}")
+            return False
+
+    def _evaluate_expression(self, expression, row):
+        """Safely evaluate a mathematical expression using row values."""
+        try:
+            # Create a safe dict with only the row values
+            safe_dict = dict(row)
+            # Add some safe mathematical functions
+            safe_dict.update({
+                'abs': abs,
+                'round': round,
+                'max': max,
+                'min': min
+            })
+            return eval(expression, {"__builtins__": {}}, safe_dict)
+        except Exception as e:
+            logger.error(f"Error evaluating expression {expression}: {str(e)}")
+            raise
+
+    def _evaluate_operator(self, field_value, operator, value):
+        """Evaluate a comparison operator."""
+        try:
+            # Convert value to appropriate type if needed
+            if isinstance(field_value, (int, float)) and isinstance(value, str):
+                try:
+                    value = float(value)
+                except ValueError:
+                    pass
+            
+            # Handle different operators
+            if operator == ">":
+                return field_value > value
+            elif operator == "<":
+                return field_value < value
+            elif operator == "==":
+                return field_value == value
+            elif operator == "!=":
+                return field_value != value
+            elif operator == ">=":
+                return field_value >= value
+            elif operator == "<=":
+                return field_value <= value
+            elif operator.lower() == "contains":
+                return str(value).lower() in str(field_value).lower()
+            elif operator.lower() == "startswith":
+                return str(field_value).lower().startswith(str(value).lower())
+            elif operator.lower() == "endswith":
+                return str(field_value).lower().endswith(str(value).lower())
             else:
                 logger.warning(f"Unsupported operator: {operator}")
                 return False
@@ -1272,8 +3957,67 @@ class FlagManager:
             logger.error(f"Error comparing values ({field_value} {operator} {value}): {str(e)}")
             return False
 
+    def compile_rules(self):
+        """Compile flag_rules into vectorized rules; done once and reused for every DataFrame."""
+        if self._compiled_rules is None:
+            compiled = []
+            for rule_key, rules in self.flag_rules.items():
+                for rule in (rules if isinstance(rules, list) else [rules]):
+                    if not isinstance(rule, dict):
+                        logger.warning(f"Skipping malformed flag rule under '{rule_key}'")
+                        continue
+                    conditions = rule.get('conditions') or []
+                    # The flagged column defaults to the first condition's field
+                    column = rule.get('field') or next(
+                        (c.get('field') for c in conditions if c.get('field')), None)
+                    compiled.append(CompiledFlagRule(
+                        name=rule.get('name', rule_key),
+                        column=column,
+                        severity=rule.get('severity'),
+                        color=rule.get('color', rule.get('flag_color')),
+                        text_color=rule.get('text_color', "#000000"),
+                        conditions=conditions,
+                        fallback=self._evaluate_operator
+                    ))
+            self._compiled_rules = compiled
+            logger.info(f"Compiled {len(compiled)} flag rules")
+        return self._compiled_rules
+
+    def flag_dataframe(self, df):
+        """
+        Evaluate every compiled rule against a DataFrame in one pass per rule.
+
+        Returns:
+            list: Flagged records with 'index', 'column', 'color', 'severity' and 'text_color'
+        """
+        flagged_data = []
+        if df is None or df.empty:
+            return flagged_data
+
+        for rule in self.compile_rules():
+            try:
+                mask = rule.mask(df)
+            except Exception as e:
+                logger.error(f"Error evaluating flag rule {rule.name}: {str(e)}")
+                continue
+
+            for index in df.index[mask]:
+                flagged_data.append({
+                    'index': index,
+                    'column': rule.column,
+                    'color': rule.color,
+                    'severity': rule.severity,
+                    'text_color': rule.text_color
+                })
+
+        return flagged_data
+
     def save_flagged_data(self, flagged_data, table_name):
         """Save flagged data to database with proper error handling and validation."""
+        if self.flag_sink is not None:
+            self.flag_sink.add(flagged_data, table_name)
+            return
+        
         if not self.db_cursor:
             logger.warning("No database cursor available. Skipping save_flagged_data.")
             return
@@ -1324,6 +4068,106 @@ class FlagManager:
                 self.db_cursor.rollback()
             raise
 
+class CompiledFlagRule:
+    """A flag rule compiled into a single boolean mask over DataFrame columns."""
+    COMPARISONS = {
+        ">": lambda series, value: series > value,
+        "<": lambda series, value: series < value,
+        "==": lambda series, value: series == value,
+        "!=": lambda series, value: series != value,
+        ">=": lambda series, value: series >= value,
+        "<=": lambda series, value: series <= value,
+    }
+    TEXT_OPERATORS = ("contains", "startswith", "endswith")
+
+    def __init__(self, name, column, severity, color, text_color, conditions, fallback=None):
+        self.name = name
+        self.column = column
+        self.severity = severity
+        self.color = color
+        self.text_color = text_color
+        self.fallback = fallback
+        self.has_conditions = bool(conditions)
+
+        # Normalize operators and values once instead of once per row
+        self.conditions = []
+        for condition in conditions:
+            field = condition.get("field")
+            operator = condition.get("operator")
+            value = condition.get("value")
+
+            if not all([field, operator]):
+                logger.warning(f"Missing required condition fields: {condition}")
+                continue
+
+            if str(operator).lower() in self.TEXT_OPERATORS:
+                operator = str(operator).lower()
+                value = str(value).lower()
+            elif operator not in self.COMPARISONS:
+                logger.warning(f"Unsupported operator: {operator}")
+
+            self.conditions.append((field, operator, value))
+
+    def mask(self, df):
+        """Return a boolean array marking the rows of df that satisfy every condition (AND logic)."""
+        if not self.has_conditions:
+            return np.zeros(len(df), dtype=bool)
+
+        result = np.ones(len(df), dtype=bool)
+        for field, operator, value in self.conditions:
+            # Skip conditions on fields the frame does not have
+            if field not in df.columns:
+                logger.warning(f"Field '{field}' not found in DataFrame")
+                continue
+
+            result &= self._condition_mask(df[field], operator, value)
+            if not result.any():
+                break
+
+        return result
+
+    def _condition_mask(self, series, operator, value):
+        """Evaluate one condition for a whole column; NaN values skip the condition."""
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            # Evaluate each category once and look the rows up by code
+            categories = pd.Series(series.cat.categories, name=series.name)
+            codes = series.cat.codes.to_numpy()
+            matched = self._condition_mask(categories, operator, value)
+            return np.where(codes >= 0, matched[codes], True)
+
+        skip = series.isna().to_numpy()
+
+        try:
+            if operator in self.COMPARISONS:
+                # Coerce the rule value once per column rather than once per cell
+                if isinstance(value, str) and pd.api.types.is_numeric_dtype(series) \
+                        and not pd.api.types.is_bool_dtype(series):
+                    try:
+                        value = float(value)
+                    except ValueError:
+                        pass
+                hit = self.COMPARISONS[operator](series, value)
+            elif operator in self.TEXT_OPERATORS:
+                text = series.astype(str).str.lower()
+                if operator == "contains":
+                    hit = text.str.contains(value, regex=False)
+                elif operator == "startswith":
+                    hit = text.str.startswith(value)
+                else:
+                    hit = text.str.endswith(value)
+            else:
+                return skip
+
+            hit = hit.fillna(False).to_numpy(dtype=bool)
+        except Exception as e:
+            if self.fallback is None:
+                logger.error(f"Error comparing column {series.name} {operator} {value}: {str(e)}")
+                return skip
+            # Mixed-type columns: fall back to the per-value comparison
+            hit = series.map(lambda field_value: bool(self.fallback(field_value, operator, value))).to_numpy(dtype=bool)
+
+        return skip | hit
+
 class FirstPassDocTemplate(SimpleDocTemplate):
     """Custom document template for first pass to collect page numbers."""
     def __init__(self, *args, **kwargs):
@@ -1351,7 +4195,101 @@ class FirstPassDocTemplate(SimpleDocTemplate):
                 self.current_section = text
                 self.section_page_map[text] = self.current_page
 
+class DeferredTOCEntry(Flowable):
+    """
+    A TOC line whose page number is drawn from a forward-referenced form.
+
+    The entry has a fixed height, so the TOC takes the same space whatever the final page
+    numbers are and the story never has to be laid out a second time.
+    """
+    def __init__(self, text, form_name, style, leftIndent=0):
+        Flowable.__init__(self)
+        self.text = text
+        self.form_name = form_name
+        self.style = style
+        self.leftIndent = leftIndent
+        self.width = 0
+        self.height = style.leading
+
+    def wrap(self, availWidth, availHeight):
+        self.width = availWidth
+        return (self.width, self.height)
+
+    def draw(self):
+        canvas = self.canv
+        font_name = self.style.fontName
+        font_size = self.style.fontSize
+        baseline = (self.height - font_size) / 2.0
+
+        # Leave room for the page number on the right
+        number_width = pdfmetrics.stringWidth("0000", font_name, font_size)
+        text = f"{self.text} "
+        text_width = pdfmetrics.stringWidth(text, font_name, font_size)
+        dot_width = pdfmetrics.stringWidth(".", font_name, font_size)
+        dots = "." * max(5, int((self.width - self.leftIndent - text_width - number_width) / dot_width))
+
+        canvas.saveState()
+        canvas.setFont(font_name, font_size)
+        canvas.drawString(self.leftIndent, baseline, text + dots)
+        canvas.translate(self.width, baseline)
+        canvas.doForm(self.form_name)
+        canvas.restoreState()
+
+class SinglePassDocTemplate(SimpleDocTemplate):
+    """
+    Document template that lays the story out once.
+
+    Section pages are tracked from afterFlowable while the document is built, and the TOC
+    page numbers (see DeferredTOCEntry) are written as forms just before the canvas is saved.
+    """
+    def __init__(self, *args, **kwargs):
+        self.on_page = kwargs.pop('on_page', None)
+        self.toc_font_name = kwargs.pop('toc_font_name', 'Helvetica')
+        self.toc_font_size = kwargs.pop('toc_font_size', 11)
+        super().__init__(*args, **kwargs)
+        self.section_page_map = {}
+        self.page_references = {}
+        # Save the canvas ourselves once the page number forms exist
+        self._doSave = 0
+
+    def register_page_reference(self, section):
+        """Return the form name that will hold the page number of a section."""
+        form_name = f"toc_page_{len(self.page_references)}"
+        self.page_references[form_name] = section
+        return form_name
+
+    def afterFlowable(self, flowable):
+        """Track sections for TOC."""
+        if isinstance(flowable, Paragraph) and flowable.style.name == 'Heading1':
+            # Keep the first page a heading lands on
+            self.section_page_map.setdefault(flowable.getPlainText(), self.page)
+
+    def build(self, flowables, *args, **kwargs):
+        super().build(flowables, *args, **kwargs)
+        self._write_page_references()
+        self.canv.save()
+
+    def _write_page_references(self):
+        """Define the page number form referenced by each TOC entry."""
+        canvas = self.canv
+        for form_name, section in self.page_references.items():
+            page_num = self.section_page_map.get(section, "")
+            canvas.beginForm(form_name, lowerx=-100, lowery=-10, upperx=0, uppery=self.toc_font_size * 2)
+            canvas.setFont(self.toc_font_name, self.toc_font_size)
+            canvas.drawRightString(0, 0, str(page_num))
+            canvas.endForm()
+
+def _render_section_worker(payload):
+    """Process pool entry point: render one section with a fresh engine."""
+    config, env, section_name, section_data = payload
+    engine = ReportEngine(config, scenarios=None, db_cursor=None, env=env)
+    return engine.render_section_pdf(section_name, section_data)
+
 if __name__ == "__main__":
+    import yaml
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
     # 1) Load configuration from YAML
     with open("config.yaml", "r") as f:
         config = yaml.safe_load(f)
@@ -1360,9 +4298,10 @@ if __name__ == "__main__":
     if "flag_rules" not in config:
         config["flag_rules"] = {}
 
-    # 2) Load data from CSV
-    #    Replace 'sample_data.csv' with your actual CSV file path
-    df = pd.read_csv("sample_data.csv")
+    # 2) Load data (CSV, Parquet or Arrow), only the columns the config uses
+    #    Set common.input_path to your extract; it defaults to 'sample_data.csv'
+    extract_cache = ExtractCache.from_config(config["common"])
+    df = ReportDataLoader(config, extract_cache).load(config["common"].get("input_path", "sample_data.csv"))
 
     # 3) Create the engine
     #    Scenarios and db_cursor can be None or replaced with real objects if needed
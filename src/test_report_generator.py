@@ -0,0 +1,29 @@
+import pandas as pd
+import pytest
+
+from report_generator import FilterExpression
+
+
+@pytest.mark.parametrize("value", [
+    "In Progress",
+    "Not Applicable",
+    "Null",
+    "Between Funds",
+    "(Legacy) Fund",
+    "O'Brien",
+])
+def test_plain_values_that_look_like_grammar_match_literally(value):
+    df = pd.DataFrame({"STATUS": [value, "Other", None]})
+    expression = FilterExpression.compile(value)
+    assert expression.mask(df, "STATUS").tolist() == [True, False, False]
+
+
+@pytest.mark.parametrize("condition, expected", [
+    ("in ('A', 'C')", [True, False, True]),
+    ("not in ('A')", [False, True, True]),
+    ("is null", [False, False, False]),
+    ("> B", [False, False, True]),
+])
+def test_grammar_conditions_still_parse(condition, expected):
+    df = pd.DataFrame({"CODE": ["A", "B", "C"]})
+    assert FilterExpression.compile(condition).mask(df, "CODE").tolist() == expected